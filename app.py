@@ -1,34 +1,205 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session
+from flask import Flask, render_template, request, redirect, url_for, flash, session, current_app, make_response, send_file, abort, jsonify, g, has_request_context, stream_with_context, stream_template, get_flashed_messages
+import click
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as FlaskSQLAlchemySession
+from markupsafe import Markup
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 import os
-import requests
-from bs4 import BeautifulSoup
+from html.parser import HTMLParser
 from urllib.parse import urlparse, urljoin
-from Levenshtein import distance
 from enum import Enum
 import logging
 import time
-from datetime import datetime
-from sqlalchemy import text
-from sqlalchemy.exc import DBAPIError, SQLAlchemyError, OperationalError
+import hashlib
+import codecs
+import itertools
+import tempfile
+import uuid
+import io
+import re
+import csv
+import json
+import base64
+import hmac
+import secrets
+import binascii
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy import event, inspect
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.orm import load_only, joinedload
+from sqlalchemy.sql.expression import SelectBase
+from functools import wraps
+from sqlalchemy.exc import SQLAlchemyError, OperationalError, IntegrityError
 from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from db_health import circuit_breaker, start_monitor, BREAKER_COOLDOWN
+import metrics
+from querylog import query_log
+from compression import compress_response
+from search import create_search_index, search_statement
+from urls import canonical_url, url_hash, is_short_url
+from migrations import runner as migration_runner
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Read replica settings
+REPLICA_DATABASE_URL = os.environ.get('REPLICA_DATABASE_URL')
+if REPLICA_DATABASE_URL and REPLICA_DATABASE_URL.startswith('postgres://'):
+    REPLICA_DATABASE_URL = REPLICA_DATABASE_URL.replace('postgres://', 'postgresql://', 1)
+REPLICA_LAG_WINDOW = float(os.environ.get('REPLICA_LAG_WINDOW', 5))  # seconds a session reads from the primary after writing
+
+class RoutingSession(FlaskSQLAlchemySession):
+    """Session that sends reads inside replica_reads() to the replica.
+
+    Flushes and every statement that is not a SELECT go to the primary and
+    mark the browser session as having written, which keeps that user's
+    reads on the primary for REPLICA_LAG_WINDOW seconds.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and 'replica' in self._db.engines:
+            if self._flushing or not isinstance(clause, SelectBase):
+                mark_database_write()
+            elif use_replica():
+                return self._db.engines['replica']
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def mark_database_write():
+    if has_request_context():
+        g.database_written = True
+        session['db_written_at'] = time.time()
+
+def use_replica():
+    """True if reads may go to the replica for the current request."""
+    if not has_request_context() or not g.get('read_replica') or g.get('database_written'):
+        return False
+    return time.time() - session.get('db_written_at', 0) >= REPLICA_LAG_WINDOW
+
+@contextmanager
+def replica_reads(enabled=True):
+    """Route SELECTs in this block to the replica (or, with enabled=False, to the primary)."""
+    previous = g.get('read_replica', False)
+    g.read_replica = enabled
+    try:
+        yield
+    finally:
+        g.read_replica = previous
+
+def read_replica(view):
+    """Decorator for read-only views whose queries may use the replica."""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        with replica_reads():
+            return view(*args, **kwargs)
+    return wrapped
+
 # Initialize extensions
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login_manager = LoginManager()
 
+# 'app' checks the schema in create_app; gunicorn.conf.py sets 'master' to
+# check it once in the gunicorn master instead of in every worker
+SCHEMA_CHECK = os.environ.get('SCHEMA_CHECK', 'app')
+
 # Connection management settings
 MAX_RETRIES = 3
 RETRY_DELAY = 0.1  # seconds
-HEALTH_CHECK_INTERVAL = 30  # seconds
-last_health_check = 0
-connection_errors = 0
-MAX_CONNECTION_ERRORS = 3
+
+# Metadata enrichment settings
+METADATA_WORKERS = int(os.environ.get('METADATA_WORKERS', 4))  # Concurrent fetches per process
+METADATA_MAX_ATTEMPTS = 3
+METADATA_RETRY_DELAY = 2  # seconds
+# Fetches queued in a worker that was restarted are lost; wishes pending for
+# longer than this are queued again, and after METADATA_GIVE_UP_AFTER marked failed
+METADATA_STALE_AFTER = int(os.environ.get('METADATA_STALE_AFTER', 600))  # seconds
+METADATA_GIVE_UP_AFTER = int(os.environ.get('METADATA_GIVE_UP_AFTER', 24 * 3600))  # seconds
+METADATA_REQUEUE_INTERVAL = 300  # seconds between checks per process
+metadata_executor = None
+
+# Metadata cache settings
+METADATA_CACHE_SIZE = int(os.environ.get('METADATA_CACHE_SIZE', 1024))  # Entries kept in memory
+METADATA_CACHE_TTL = int(os.environ.get('METADATA_CACHE_TTL', 24 * 3600))  # seconds
+METADATA_CACHE_NEGATIVE_TTL = int(os.environ.get('METADATA_CACHE_NEGATIVE_TTL', 600))  # seconds
+
+# Outbound HTTP settings
+HTTP_MAX_PER_HOST = int(os.environ.get('HTTP_MAX_PER_HOST', 2))  # Concurrent requests per domain
+HTTP_POOL_HOSTS = 50  # Hosts with a keep-alive pool
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', 3.05))  # seconds
+HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', 5))  # seconds
+HTTP_RETRIES = int(os.environ.get('HTTP_RETRIES', 2))
+HTTP_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+# Metadata extraction settings
+METADATA_MAX_BYTES = int(os.environ.get('METADATA_MAX_BYTES', 512 * 1024))  # Hard cap per page
+METADATA_CHUNK_SIZE = 16 * 1024  # bytes
+# <meta charset="..."> or <meta http-equiv="Content-Type" content="...; charset=...">
+META_CHARSET = re.compile(rb'<meta[^>]*?charset\s*=\s*["\']?\s*([\w.:-]+)', re.IGNORECASE)
+
+# Thumbnail cache settings
+THUMBNAIL_CACHE_DIR = os.environ.get('THUMBNAIL_CACHE_DIR',
+                                     os.path.join(tempfile.gettempdir(), 'wishlist-thumbnails'))
+THUMBNAIL_CACHE_MAX_BYTES = int(os.environ.get('THUMBNAIL_CACHE_MAX_BYTES', 200 * 1024 * 1024))
+THUMBNAIL_MAX_SOURCE_BYTES = 5 * 1024 * 1024  # Largest image we download
+THUMBNAIL_MAX_SOURCE_PIXELS = 16 * 1000 * 1000  # Largest image we decode, after JPEG draft scaling
+THUMBNAIL_HEIGHT = 320  # pixels, twice the 160px shown on the dashboard
+THUMBNAIL_QUALITY = 80
+THUMBNAIL_MAX_AGE = 365 * 24 * 3600  # seconds, thumbnails never change
+
+# Bulk import settings
+IMPORT_MAX_ROWS = 200
+IMPORT_MAX_BYTES = 1024 * 1024  # Largest accepted upload
+
+# JSON API settings
+API_PAGE_SIZE = 20
+API_MAX_PAGE_SIZE = 100
+API_WISH_FIELDS = ('id', 'name', 'url', 'description', 'thumbnail_url', 'thumbnail_hash', 'priority',
+                   'metadata_status', 'created_at', 'updated_at')
+
+# Search settings
+SEARCH_PAGE_SIZE = 20
+
+# Dashboard fragment cache settings
+FRAGMENT_CACHE = os.environ.get('FRAGMENT_CACHE', 'filesystem')  # 'filesystem' or 'memory'
+FRAGMENT_CACHE_DIR = os.environ.get('FRAGMENT_CACHE_DIR',
+                                    os.path.join(tempfile.gettempdir(), 'wishlist-fragments'))
+FRAGMENT_CACHE_SIZE = int(os.environ.get('FRAGMENT_CACHE_SIZE', 500))  # Entries, memory backend only
+
+# Logged-in user cache settings
+USER_CACHE_SIZE = 256
+USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 60))  # seconds
+
+# Live dashboard update settings
+CHANGES_STREAM_SECONDS = int(os.environ.get('CHANGES_STREAM_SECONDS', 25))  # seconds a stream stays open, 0 answers at once
+CHANGES_RETRY = int(os.environ.get('CHANGES_RETRY', 3))  # seconds before the browser reconnects
+CHANGES_POLL_INTERVAL = float(os.environ.get('CHANGES_POLL_INTERVAL', 1))  # seconds
+CHANGES_HEARTBEAT = 15  # seconds between keep-alive comments
+CHANGES_BATCH = 100  # Changes read per query
+CHANGES_RETENTION = 24 * 3600  # seconds
+CHANGES_PRUNE_INTERVAL = 3600  # seconds
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waits for a connection."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.DB_POOL_WAIT.observe(time.perf_counter() - started)
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_started = time.perf_counter()
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Only count statements issued by the request thread, not background jobs
+    if context is not None and has_request_context():
+        g.sql_queries = g.get('sql_queries', 0) + 1
+        g.sql_seconds = g.get('sql_seconds', 0.0) + time.perf_counter() - context._query_started
 
 @contextmanager
 def safe_db_session():
@@ -41,59 +212,30 @@ def safe_db_session():
         db.session.rollback()
         raise
 
-def check_db_connection():
-    """Check database connection and attempt to reconnect if needed."""
-    global last_health_check, connection_errors
-    
-    current_time = datetime.utcnow().timestamp()
-    if current_time - last_health_check < HEALTH_CHECK_INTERVAL:
-        return connection_errors < MAX_CONNECTION_ERRORS
-        
-    try:
-        with safe_db_session() as session:
-            session.execute(text('SELECT 1'))
-            last_health_check = current_time
-            connection_errors = 0  # Reset error count on successful connection
-            return True
-    except (DBAPIError, SQLAlchemyError) as e:
-        logger.error(f"Database connection check failed: {str(e)}")
-        connection_errors += 1
-        
-        if connection_errors >= MAX_CONNECTION_ERRORS:
-            logger.error("Maximum connection errors reached")
-            return False
-            
-        try:
-            db.session.remove()
-            db.engine.dispose()
-            with safe_db_session() as session:
-                session.execute(text('SELECT 1'))
-            last_health_check = current_time
-            connection_errors = 0  # Reset error count on successful reconnection
-            return True
-        except Exception as e:
-            logger.error(f"Database reconnection failed: {str(e)}")
-            return False
-
 def retry_db_operation(operation):
     """Retry database operations with exponential backoff."""
     last_error = None
     
     for attempt in range(MAX_RETRIES):
         try:
-            if not check_db_connection():
-                raise OperationalError("Database connection failed", None, None)
+            if not circuit_breaker.allow_request():
+                raise OperationalError("Database circuit breaker is open", None, None)
                 
             with safe_db_session() as session:
                 return operation()
                 
         except OperationalError as e:
             last_error = e
+            # Only a lost connection says anything about the database's health;
+            # locks, deadlocks and timeouts are this query's problem
+            if e.connection_invalidated:
+                circuit_breaker.record_failure()
             if attempt == MAX_RETRIES - 1:
                 logger.error(f"Max retries reached for database operation: {str(e)}")
                 raise
             delay = RETRY_DELAY * (2 ** attempt)
             logger.warning(f"Database operation failed, retrying in {delay}s. Error: {str(e)}")
+            metrics.DB_RETRIES.inc()
             time.sleep(delay)
         except SQLAlchemyError as e:
             logger.error(f"Database error: {str(e)}")
@@ -113,14 +255,40 @@ class Priority(Enum):
         }
         return labels.get(value, "Keine Priorität")
 
+class MetadataStatus(Enum):
+    PENDING = 'pending'
+    DONE = 'done'
+    FAILED = 'failed'
+
+class ChangeKind(Enum):
+    WISH_ADDED = 'wish_added'
+    WISH_UPDATED = 'wish_updated'
+    WISH_DELETED = 'wish_deleted'
+    USER_ADDED = 'user_added'
+    USER_DELETED = 'user_deleted'
+
+class Family(db.Model):
+    """A group of users sharing one dashboard, joined through its invite token."""
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    invite_token = db.Column(db.String(64), unique=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 class User(db.Model, UserMixin):
+    # Names are unique per family; the constraint also indexes family_id lookups
+    __table_args__ = (db.UniqueConstraint('family_id', 'name', name='uq_user_family_name'),)
+
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(80), unique=True, nullable=False)
-    wishes = db.relationship('Wish', backref='owner', lazy=True, cascade='all, delete-orphan')
+    name = db.Column(db.String(80), nullable=False)
+    family_id = db.Column(db.Integer, db.ForeignKey('family.id'), nullable=False)
+    # Ordered in the database by priority, then newest first
+    wishes = db.relationship('Wish', backref='owner', lazy=True, cascade='all, delete-orphan',
+                             order_by='[Wish.priority, Wish.id.desc()]')
 
     def delete_account(self):
         def _delete():
             db.session.delete(self)
+            record_change(self.family_id, self.id, ChangeKind.USER_DELETED)
             db.session.commit()
         return retry_db_operation(_delete)
 
@@ -128,77 +296,1325 @@ class Wish(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     url = db.Column(db.String(2000), nullable=False)
     name = db.Column(db.String(200))
+    description = db.Column(db.String(500))  # From the page's meta description, searchable
     thumbnail_url = db.Column(db.String(2000))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    family_id = db.Column(db.Integer, db.ForeignKey('family.id'), nullable=False)  # Copied from the owner
     priority = db.Column(db.Integer, default=2)  # Default to WOULD_BE_NICE
+    metadata_status = db.Column(db.String(20), default=MetadataStatus.DONE.value)
+    thumbnail_hash = db.Column(db.String(64))  # Digest of the locally cached thumbnail
+    url_hash = db.Column(db.String(64))  # SHA-256 of the canonical URL, see urls.py
 
     @property
     def priority_label(self):
         return Priority.get_label(self.priority)
 
-    def fetch_metadata(self):
-        """Fetch metadata from URL and set name and thumbnail."""
+    @property
+    def metadata_pending(self):
+        return self.metadata_status == MetadataStatus.PENDING.value
+
+    def fetch_metadata(self, refresh=False):
+        """Fetch metadata from URL and set name and thumbnail.
+
+        Returns True if the page could be fetched, False otherwise.
+        Cached results are used unless refresh is set.
+        """
         if not self.url:
-            return
+            return True
 
-        try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-            response = requests.get(self.url, headers=headers, timeout=5)
-            response.raise_for_status()  # Raise exception for bad status codes
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Get title if name is not provided
+        metadata = metadata_cache.lookup(self.url, refresh=refresh)
+        if metadata is None:
+            # Ensure we at least have a name
             if not self.name:
-                # Try meta title first
-                meta_title = soup.find('meta', property='og:title')
-                if meta_title and meta_title.get('content'):
-                    self.name = meta_title.get('content')
+                self.name = urlparse(self.url).netloc
+            return False
+
+        # Get title if name is not provided, else use the domain name
+        if not self.name:
+            self.name = (metadata['title'] or urlparse(self.url).netloc)[:200]
+        if is_short_url(self.url) and metadata.get('url'):
+            # Duplicates are found by where a short link leads
+            self.url_hash = url_hash(metadata['url'])
+        if metadata.get('description'):
+            self.description = metadata['description']
+        if metadata['thumbnail_url']:
+            self.thumbnail_url = metadata['thumbnail_url']
+        return True
+
+    def copy_metadata(self, other):
+        """Take the fetched details of another wish for the same URL instead of fetching again."""
+        self.name = self.name or other.name
+        self.description = other.description
+        self.thumbnail_url = other.thumbnail_url
+        self.thumbnail_hash = other.thumbnail_hash
+        self.metadata_status = MetadataStatus.DONE.value
+
+# Serves the per-user listing order of the dashboard and the API; created by
+# migrations/add_wish_indexes.py on existing databases
+db.Index('ix_wish_user_priority', Wish.user_id, Wish.priority, Wish.id.desc())
+# Count and newest change of a family's wishes for the dashboard ETag;
+# created by migrations/add_families.py on existing databases
+db.Index('ix_wish_family_updated', Wish.family_id, Wish.updated_at)
+# Duplicate lookup by canonical URL; created by migrations/add_url_hash.py on
+# existing databases
+db.Index('ix_wish_family_url_hash', Wish.family_id, Wish.url_hash)
+
+@event.listens_for(Wish.__table__, 'after_create')
+def create_wish_search_index(target, connection, **kw):
+    # FTS5 table and triggers, or the tsvector column; created by
+    # migrations/add_wish_search.py on existing databases
+    create_search_index(connection)
+
+class WishChange(db.Model):
+    """Append-only feed of changes to a family's dashboard, streamed by /changes."""
+    # AUTOINCREMENT keeps SQLite from reusing ids once old changes are pruned
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    id = db.Column(db.Integer, primary_key=True)  # Sequence number clients resume from
+    family_id = db.Column(db.Integer, db.ForeignKey('family.id'), nullable=False)
+    user_id = db.Column(db.Integer, nullable=False)  # No foreign key, outlives deleted users
+    wish_id = db.Column(db.Integer)
+    kind = db.Column(db.String(20), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {'id': self.id, 'kind': self.kind, 'user_id': self.user_id, 'wish_id': self.wish_id}
+
+# A family's changes in feed order; created by migrations/add_wish_changes.py
+# on existing databases
+db.Index('ix_wish_change_family', WishChange.family_id, WishChange.id)
+
+def record_change(family_id, user_id, kind, wish_id=None):
+    """Append a change to the family's feed, committed with the caller's transaction."""
+    db.session.add(WishChange(family_id=family_id, user_id=user_id, wish_id=wish_id, kind=kind.value))
+
+class UrlMetadata(db.Model):
+    """Shared cache of page metadata, keyed by the hash of the canonical URL."""
+    url_key = db.Column(db.String(64), primary_key=True)
+    url = db.Column(db.String(2000), nullable=False)  # Canonical URL of the page, after redirects
+    title = db.Column(db.String(200))
+    description = db.Column(db.String(500))
+    thumbnail_url = db.Column(db.String(2000))
+    ok = db.Column(db.Boolean, nullable=False, default=True)  # False caches a failed fetch
+    fetched_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class HttpClient:
+    """Shared outbound HTTP client for metadata fetching.
+
+    Keeps one requests.Session per process with keep-alive connection pools
+    per host, caps concurrent requests per domain, uses separate connect and
+    read timeouts and retries idempotent requests with backoff.
+    """
+
+    def __init__(self, max_per_host, pool_hosts, connect_timeout, read_timeout, retries):
+        self.max_per_host = max_per_host
+        self.pool_hosts = pool_hosts
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self._session = None
+        self._pid = None
+        self._host_slots = {}  # host -> [semaphore, requests holding or waiting]
+        self._lock = threading.Lock()
+        self._stats = {'requests': 0, 'errors': 0, 'seconds': 0.0}
+
+    def _get_session(self):
+        # Sessions hold sockets, so never reuse one inherited through fork
+        with self._lock:
+            if self._session is None or self._pid != os.getpid():
+                # Imported on first use; most workers never fetch a page
+                import requests
+                from requests.adapters import HTTPAdapter
+                from urllib3.util.retry import Retry
+                retry = Retry(total=self.retries, backoff_factor=0.5,
+                              status_forcelist=(429, 500, 502, 503, 504),
+                              allowed_methods=frozenset(['GET', 'HEAD']),
+                              raise_on_status=False)
+                adapter = HTTPAdapter(pool_connections=self.pool_hosts,
+                                      pool_maxsize=self.max_per_host,
+                                      max_retries=retry)
+                session = requests.Session()
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                session.headers['User-Agent'] = HTTP_USER_AGENT
+                self._session, self._pid = session, os.getpid()
+                self._host_slots = {}
+            return self._session
+
+    @contextmanager
+    def _slot(self, url):
+        """Hold one of the host's request slots. A host's entry only exists
+        while requests to it run or wait, so idle hosts take no memory."""
+        host = urlparse(url).netloc.lower()
+        with self._lock:
+            entry = self._host_slots.get(host)
+            if entry is None:
+                entry = self._host_slots[host] = [threading.BoundedSemaphore(self.max_per_host), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0 and self._host_slots.get(host) is entry:
+                    del self._host_slots[host]
+
+    def stats(self):
+        """Return request count, error count and total seconds spent."""
+        with self._lock:
+            return dict(self._stats)
+
+    @contextmanager
+    def get(self, url, **kwargs):
+        """Stream a GET response; the per-host slot is held until the body is closed."""
+        session = self._get_session()
+        with self._slot(url):
+            started = time.perf_counter()
+            failed = False
+            try:
+                with session.get(url, timeout=self.timeout, stream=True, **kwargs) as response:
+                    yield response
+            except Exception:
+                failed = True
+                raise
+            finally:
+                with self._lock:
+                    self._stats['requests'] += 1
+                    self._stats['errors'] += failed
+                    self._stats['seconds'] += time.perf_counter() - started
+
+http_client = HttpClient(max_per_host=HTTP_MAX_PER_HOST,
+                         pool_hosts=HTTP_POOL_HOSTS,
+                         connect_timeout=HTTP_CONNECT_TIMEOUT,
+                         read_timeout=HTTP_READ_TIMEOUT,
+                         retries=HTTP_RETRIES)
+
+class MetadataParser(HTMLParser):
+    """Incremental HTML parser that only collects the tags needed for
+    wish metadata: meta/link image hints, the title and the first image."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.meta = {}  # lowercased meta property/name -> content
+        self.image_src = None
+        self.title = None
+        self.first_img = None
+        self.head_done = False
+        self._title_parts = None
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'meta':
+            key = attrs.get('property') or attrs.get('name')
+            if key and attrs.get('content'):
+                self.meta.setdefault(key.lower(), attrs['content'])
+        elif tag == 'link':
+            rel = (attrs.get('rel') or '').lower().split()
+            if 'image_src' in rel and attrs.get('href') and self.image_src is None:
+                self.image_src = attrs['href']
+        elif tag == 'title' and self.title is None:
+            self._title_parts = []
+        elif tag == 'img':
+            if attrs.get('src') and self.first_img is None:
+                self.first_img = attrs['src']
+        elif tag == 'body':
+            self.head_done = True
+
+    def handle_endtag(self, tag):
+        if tag == 'title' and self._title_parts is not None:
+            self.title = ''.join(self._title_parts).strip() or None
+            self._title_parts = None
+        elif tag == 'head':
+            self.head_done = True
+
+    def handle_data(self, data):
+        if self._title_parts is not None:
+            self._title_parts.append(data)
+
+    @property
+    def meta_image(self):
+        return (self.meta.get('og:image') or
+                self.meta.get('twitter:image') or
+                self.meta.get('thumbnail') or
+                self.image_src)
+
+    @property
+    def done(self):
+        """True once the head is parsed and an image candidate was found."""
+        return self.head_done and bool(self.meta_image or self.first_img)
+
+def sniff_charset(head):
+    """Return the charset declared in a <meta> tag in the first bytes of a page, or None."""
+    match = META_CHARSET.search(head)
+    if not match:
+        return None
+    charset = match.group(1).decode('ascii').lower()
+    # A page whose <meta> tag could be read as ASCII is not really UTF-16
+    return 'utf-8' if charset.startswith('utf-16') else charset
+
+def fetch_url_metadata(url):
+    """Download a page and extract its title, description and thumbnail URL,
+    along with the canonical URL the page was served from after redirects.
+
+    The body is streamed and parsing stops as soon as the head (or, without
+    meta images, the first <img>) has been seen, or METADATA_MAX_BYTES were read.
+    """
+    with http_client.get(url) as response:
+        response.raise_for_status()  # Raise exception for bad status codes
+
+        # Without an explicit charset, requests assumes ISO-8859-1; the page
+        # may declare one in a <meta> tag instead, and most shops send UTF-8
+        header_encoding = None
+        if 'charset' in response.headers.get('Content-Type', '').lower() and response.encoding:
+            header_encoding = response.encoding
+
+        final_url = response.url or url
+        parser = MetadataParser()
+        decoder = None
+        received = 0
+        for chunk in response.iter_content(chunk_size=METADATA_CHUNK_SIZE):
+            received += len(chunk)
+            if decoder is None:
+                encoding = header_encoding or sniff_charset(chunk) or 'utf-8'
+                try:
+                    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+                except LookupError:
+                    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+            parser.feed(decoder.decode(chunk))
+            if parser.done or received >= METADATA_MAX_BYTES:
+                break
+
+    # Prefer og:title, fall back to the regular title
+    title = parser.meta.get('og:title') or parser.title
+
+    description = parser.meta.get('og:description') or parser.meta.get('description')
+
+    # Prefer meta image tags, fall back to the first image
+    thumbnail_url = parser.meta_image or parser.first_img
+    if thumbnail_url:
+        # Handle relative URLs
+        thumbnail_url = urljoin(url, thumbnail_url.strip())
+
+    return {
+        'url': canonical_url(final_url)[:2000],
+        'title': title.strip()[:200] if title else None,
+        'description': description.strip()[:500] if description else None,
+        'thumbnail_url': thumbnail_url[:2000] if thumbnail_url else None
+    }
+
+class MetadataCache:
+    """Two-level URL metadata cache: an in-process LRU in front of the
+    url_metadata table. Failed fetches are cached for a shorter time."""
+
+    def __init__(self, max_size, ttl, negative_ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()  # url_key -> (expires_at, metadata or None)
+        self._lock = threading.Lock()
+        self._stats = {'memory_hits': 0, 'db_hits': 0, 'misses': 0}
+
+    @staticmethod
+    def key_for(url):
+        return url_hash(url)
+
+    def stats(self):
+        """Return a copy of the hit/miss counters."""
+        with self._lock:
+            return dict(self._stats)
+
+    def lookup(self, url, refresh=False):
+        """Return cached or freshly fetched metadata for url, None if the fetch failed."""
+        key = self.key_for(url)
+        if not refresh:
+            found, metadata = self._get_memory(key)
+            if found:
+                self._count('memory_hits')
+                return metadata
+            found, metadata = self._get_db(key)
+            if found:
+                self._count('db_hits')
+                return metadata
+        self._count('misses')
+
+        started = time.perf_counter()
+        try:
+            metadata = fetch_url_metadata(url)
+            outcome = 'ok'
+        except Exception as e:
+            logger.error(f"Error fetching metadata for {url}: {str(e)}")
+            metadata = None
+            outcome = 'error'
+        metrics.METADATA_FETCH.labels(domain=urlparse(url).netloc.lower(), outcome=outcome) \
+            .observe(time.perf_counter() - started)
+        self._store(key, url, metadata)
+        return metadata
+
+    def peek(self, url):
+        """Return cached metadata for url without fetching, None if unknown or failed."""
+        key = self.key_for(url)
+        found, metadata = self._get_memory(key)
+        if not found:
+            found, metadata = self._get_db(key)
+        return metadata
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+        metrics.CACHE_LOOKUPS.labels(cache='metadata', result=name).inc()
+
+    def _ttl_for(self, metadata):
+        return self.ttl if metadata is not None else self.negative_ttl
+
+    def _get_memory(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires_at, metadata = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, metadata
+
+    def _put_memory(self, key, metadata, expires_at):
+        with self._lock:
+            self._entries[key] = (expires_at, metadata)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _get_db(self, key):
+        try:
+            with db.engine.connect() as conn:
+                row = conn.execute(
+                    db.select(UrlMetadata.url, UrlMetadata.title, UrlMetadata.description,
+                              UrlMetadata.thumbnail_url, UrlMetadata.ok, UrlMetadata.fetched_at)
+                    .where(UrlMetadata.url_key == key)
+                ).first()
+        except SQLAlchemyError as e:
+            logger.warning(f"Metadata cache lookup failed: {str(e)}")
+            return False, None
+        if row is None:
+            return False, None
+        metadata = {'url': row.url, 'title': row.title, 'description': row.description,
+                    'thumbnail_url': row.thumbnail_url} if row.ok else None
+        age = (datetime.utcnow() - row.fetched_at).total_seconds()
+        remaining = self._ttl_for(metadata) - age
+        if remaining <= 0:
+            return False, None
+        self._put_memory(key, metadata, time.time() + remaining)
+        return True, metadata
+
+    def _store(self, key, url, metadata):
+        self._put_memory(key, metadata, time.time() + self._ttl_for(metadata))
+        values = {
+            'url': metadata['url'] if metadata else canonical_url(url)[:2000],
+            'title': metadata['title'] if metadata else None,
+            'description': metadata.get('description') if metadata else None,
+            'thumbnail_url': metadata['thumbnail_url'] if metadata else None,
+            'ok': metadata is not None,
+            'fetched_at': datetime.utcnow()
+        }
+        try:
+            with db.engine.begin() as conn:
+                updated = conn.execute(
+                    db.update(UrlMetadata).where(UrlMetadata.url_key == key).values(**values)
+                ).rowcount
+                if not updated:
+                    conn.execute(db.insert(UrlMetadata).values(url_key=key, **values))
+        except IntegrityError:
+            pass  # Another worker stored the same URL concurrently
+        except SQLAlchemyError as e:
+            logger.warning(f"Metadata cache store failed: {str(e)}")
+
+metadata_cache = MetadataCache(max_size=METADATA_CACHE_SIZE,
+                               ttl=METADATA_CACHE_TTL,
+                               negative_ttl=METADATA_CACHE_NEGATIVE_TTL)
+
+def get_metadata_executor():
+    """Get the process-wide metadata executor, creating it on first use."""
+    global metadata_executor
+    if metadata_executor is None:
+        metadata_executor = ThreadPoolExecutor(max_workers=METADATA_WORKERS,
+                                               thread_name_prefix='metadata')
+    return metadata_executor
+
+def enqueue_metadata_fetch(wish_id):
+    """Schedule a background metadata fetch for a saved wish."""
+    app = current_app._get_current_object()
+    get_metadata_executor().submit(enrich_wish, app, wish_id)
+
+def enrich_wish(app, wish_id):
+    """Fetch metadata for a pending wish, retrying with exponential backoff."""
+    with app.app_context():
+        try:
+            for attempt in range(METADATA_MAX_ATTEMPTS):
+                wish = db.session.get(Wish, wish_id)
+                if wish is None:
+                    # Wish was deleted before we got to it
+                    return
+                # Retries bypass the cache so a cached failure is not reused
+                if wish.fetch_metadata(refresh=attempt > 0):
+                    if wish.thumbnail_url:
+                        wish.thumbnail_hash = cache_thumbnail(wish.thumbnail_url)
+                    wish.metadata_status = MetadataStatus.DONE.value
+                    record_change(wish.family_id, wish.user_id, ChangeKind.WISH_UPDATED, wish.id)
+                    db.session.commit()
+                    invalidate_user_fragments(wish.user_id)
+                    return
+                if attempt == METADATA_MAX_ATTEMPTS - 1:
+                    # Keep the fallback name set by fetch_metadata
+                    wish.metadata_status = MetadataStatus.FAILED.value
+                    record_change(wish.family_id, wish.user_id, ChangeKind.WISH_UPDATED, wish.id)
+                    db.session.commit()
+                    invalidate_user_fragments(wish.user_id)
+                    return
+                db.session.rollback()
+                delay = METADATA_RETRY_DELAY * (2 ** attempt)
+                logger.warning(f"Metadata fetch for wish {wish_id} failed, retrying in {delay}s")
+                time.sleep(delay)
+        except Exception as e:
+            logger.error(f"Error enriching wish {wish_id}: {str(e)}")
+            db.session.rollback()
+        finally:
+            db.session.remove()
+
+_last_requeue = 0.0
+
+def requeue_stale_metadata():
+    """Queue fetches again for wishes left pending by a lost job, at most once
+    per METADATA_REQUEUE_INTERVAL per process; give up on very old ones."""
+    global _last_requeue
+    if time.monotonic() - _last_requeue < METADATA_REQUEUE_INTERVAL:
+        return
+    _last_requeue = time.monotonic()
+    now = datetime.utcnow()
+    stale = db.and_(Wish.metadata_status == MetadataStatus.PENDING.value,
+                    db.or_(Wish.updated_at.is_(None),
+                           Wish.updated_at < now - timedelta(seconds=METADATA_STALE_AFTER)))
+    requeued, failed = [], []
+    try:
+        with db.engine.begin() as conn:
+            rows = conn.execute(db.select(Wish.id, Wish.family_id, Wish.user_id, Wish.created_at)
+                                .where(stale)).all()
+            for row in rows:
+                give_up = row.created_at is None or \
+                    row.created_at < now - timedelta(seconds=METADATA_GIVE_UP_AFTER)
+                # Conditional on still being stale, so only one process claims each wish
+                values = {'metadata_status': MetadataStatus.FAILED.value} if give_up else {}
+                claimed = conn.execute(db.update(Wish).where(Wish.id == row.id, stale)
+                                       .values(updated_at=now, **values)).rowcount
+                if not claimed:
+                    continue
+                if give_up:
+                    conn.execute(db.insert(WishChange).values(
+                        family_id=row.family_id, user_id=row.user_id, wish_id=row.id,
+                        kind=ChangeKind.WISH_UPDATED.value))
+                    failed.append(row)
                 else:
-                    # Fall back to regular title
-                    title = soup.find('title')
-                    self.name = title.string.strip() if title and title.string else None
-                
-                # If still no name, use the domain name
-                if not self.name:
-                    self.name = urlparse(self.url).netloc
-                
-                # Limit name length
-                self.name = self.name[:200] if self.name else None
-            
-            # Find thumbnail
-            # Try og:image first
-            og_image = soup.find('meta', property='og:image')
-            if og_image and og_image.get('content'):
-                self.thumbnail_url = og_image.get('content')
+                    requeued.append(row)
+    except SQLAlchemyError as e:
+        logger.warning(f"Requeueing stale metadata fetches failed: {str(e)}")
+        return
+    for user_id in {row.user_id for row in failed}:
+        invalidate_user_fragments(user_id)
+    for row in requeued:
+        enqueue_metadata_fetch(row.id)
+    if requeued or failed:
+        logger.info(f"Requeued {len(requeued)} stale metadata fetches, gave up on {len(failed)}")
+
+class ThumbnailStore:
+    """Size-bounded, content-addressed directory of resized thumbnails.
+
+    Files are named by the SHA-256 of their content, so identical images
+    are stored once and a URL for a digest never changes. When the store
+    grows past max_bytes the least recently used files are removed.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._size = None  # Bytes on disk, computed on first save
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, digest):
+        return os.path.join(self.directory, f'{digest}.webp')
+
+    def exists(self, digest):
+        return os.path.exists(self.path(digest))
+
+    def touch(self, digest):
+        """Mark a thumbnail as recently used, at most once a day."""
+        path = self.path(digest)
+        try:
+            if time.time() - os.path.getmtime(path) > 24 * 3600:
+                os.utime(path)
+        except OSError:
+            pass
+
+    def save(self, data):
+        """Store thumbnail bytes and return their digest."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if os.path.exists(path):
+            os.utime(path)
+            return digest
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._entries())
             else:
-                # Try other meta image tags
-                meta_image = (
-                    soup.find('meta', property='twitter:image') or
-                    soup.find('meta', {'name': 'thumbnail'}) or
-                    soup.find('link', rel='image_src')
-                )
-                if meta_image:
-                    self.thumbnail_url = meta_image.get('content') or meta_image.get('href')
+                self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+        return digest
+
+    def _entries(self):
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.webp'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                yield entry.path, stat.st_size, stat.st_mtime
+
+    def _evict(self):
+        # Shrink to 90% so we don't evict on every save
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        self._size = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for path, size, _ in entries:
+            if self._size <= target:
+                break
+            try:
+                os.unlink(path)
+                self._size -= size
+            except OSError:
+                pass
+        logger.info(f"Evicted thumbnails, cache now {self._size} bytes")
+
+thumbnail_store = ThumbnailStore(THUMBNAIL_CACHE_DIR, THUMBNAIL_CACHE_MAX_BYTES)
+
+def create_thumbnail(url):
+    """Download an image and return it downscaled and re-encoded as WebP."""
+    from PIL import ExifTags, Image, ImageOps
+    with http_client.get(url) as response:
+        response.raise_for_status()
+        data = bytearray()
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            data += chunk
+            if len(data) > THUMBNAIL_MAX_SOURCE_BYTES:
+                raise ValueError(f"Image larger than {THUMBNAIL_MAX_SOURCE_BYTES} bytes")
+
+    image = Image.open(io.BytesIO(data))
+    box = (THUMBNAIL_HEIGHT * 4, THUMBNAIL_HEIGHT)
+    # Let the JPEG decoder downscale while decoding
+    image.draft('RGB', box)
+    # A small, highly compressed PNG or GIF can still decode to hundreds of MB
+    if image.width * image.height > THUMBNAIL_MAX_SOURCE_PIXELS:
+        raise ValueError(f"Image larger than {THUMBNAIL_MAX_SOURCE_PIXELS} pixels")
+    if image.getexif().get(ExifTags.Base.Orientation) in (5, 6, 7, 8):
+        box = box[::-1]  # Rotated by a quarter turn below
+
+    # Shrink before transposing and converting, so neither copies the full image.
+    # Palette images only resize nearest-neighbour, so they stop at twice the
+    # size and are smoothed down after converting.
+    image.thumbnail((box[0] * 2, box[1] * 2) if image.mode in ('P', '1') else box)
+    image = ImageOps.exif_transpose(image)
+    image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+    image.thumbnail((THUMBNAIL_HEIGHT * 4, THUMBNAIL_HEIGHT))
+
+    output = io.BytesIO()
+    image.save(output, format='WEBP', quality=THUMBNAIL_QUALITY, method=4)
+    return output.getvalue()
+
+def cache_thumbnail(url):
+    """Fetch, resize and store an image; return its digest or None on failure."""
+    try:
+        return thumbnail_store.save(create_thumbnail(url))
+    except Exception as e:
+        logger.warning(f"Error caching thumbnail {url}: {str(e)}")
+        return None
+
+def enqueue_thumbnail_fetch(wish_id):
+    """Schedule a background download of a wish's thumbnail."""
+    app = current_app._get_current_object()
+    get_metadata_executor().submit(refresh_thumbnail, app, wish_id)
+
+def refresh_thumbnail(app, wish_id):
+    """Re-cache a wish's thumbnail, e.g. after it was evicted."""
+    with app.app_context():
+        try:
+            wish = db.session.get(Wish, wish_id)
+            if wish is None or not wish.thumbnail_url:
+                return
+            digest = cache_thumbnail(wish.thumbnail_url)
+            if digest and digest != wish.thumbnail_hash:
+                wish.thumbnail_hash = digest
+                record_change(wish.family_id, wish.user_id, ChangeKind.WISH_UPDATED, wish.id)
+                db.session.commit()
+                invalidate_user_fragments(wish.user_id)
+        except Exception as e:
+            logger.error(f"Error refreshing thumbnail for wish {wish_id}: {str(e)}")
+            db.session.rollback()
+        finally:
+            db.session.remove()
+
+class MemoryFragmentCache:
+    """In-process LRU store for rendered HTML fragments and version tokens.
+
+    Invalidation is only seen by the current process, so use it with a
+    single worker (e.g. the development server).
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._fragments = OrderedDict()
+        self._versions = {}
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._fragments.get(key)
+            if value is not None:
+                self._fragments.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._fragments[key] = value
+            self._fragments.move_to_end(key)
+            while len(self._fragments) > self.max_size:
+                self._fragments.popitem(last=False)
+
+    def version(self, name):
+        with self._lock:
+            return self._versions.get(name, '0')
+
+    def bump(self, name):
+        with self._lock:
+            self._versions[name] = str(next(self._counter))
+
+class FileFragmentCache:
+    """Fragment store in a local directory shared by all gunicorn workers.
+
+    Each key is a file written atomically via os.replace, in a directory
+    named after the key's first part, e.g. user1:<version>:... is stored in
+    user1/. Bumping a version empties that directory, removing the fragments
+    rendered for the previous one.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _dir(self, name):
+        return os.path.join(self.directory, name)
+
+    def _path(self, key):
+        name, _, rest = key.partition(':')
+        directory = self._dir(name)
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, rest.replace(':', '_'))
+
+    def _read(self, path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write(self, path, value):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(value)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Fragment cache write failed: {str(e)}")
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+    def get(self, key):
+        return self._read(self._path(key))
+
+    def set(self, key, value):
+        self._write(self._path(key), value)
+
+    def version(self, name):
+        return self._read(self._path(f'version:{name}')) or '0'
+
+    def bump(self, name):
+        self._write(self._path(f'version:{name}'), uuid.uuid4().hex)
+        try:
+            entries = list(os.scandir(self._dir(name)))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            try:
+                os.unlink(entry.path)
+            except OSError:
+                pass
+
+def create_fragment_cache():
+    """Create the fragment cache backend selected by FRAGMENT_CACHE."""
+    if FRAGMENT_CACHE == 'memory':
+        return MemoryFragmentCache(max_size=FRAGMENT_CACHE_SIZE)
+    if FRAGMENT_CACHE == 'filesystem':
+        return FileFragmentCache(FRAGMENT_CACHE_DIR)
+    raise ValueError(f"Unknown FRAGMENT_CACHE backend: {FRAGMENT_CACHE}")
+
+fragment_cache = create_fragment_cache()
+
+def _template_version(*names):
+    """Hash template sources so cached fragments expire on deploy."""
+    digest = hashlib.sha256()
+    for name in names:
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates', name), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+FRAGMENT_TEMPLATE_VERSION = _template_version('user_wishes.html')
+DASHBOARD_TEMPLATE_VERSION = _template_version('base.html', 'dashboard.html', 'user_wishes.html')
+
+def invalidate_user_fragments(user_id):
+    """Drop cached dashboard HTML for a user after their wishes changed."""
+    fragment_cache.bump(f'user{user_id}')
+
+class BKTree:
+    """BK-tree for Levenshtein distance lookups.
+
+    Each node stores a word, the items indexed under it and its children
+    keyed by their distance to the word. The triangle inequality lets a
+    search skip every subtree outside [d - threshold, d + threshold].
+    """
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, word, item):
+        from Levenshtein import distance
+        self.size += 1
+        if self.root is None:
+            self.root = (word, [item], {})
+            return
+        node = self.root
+        while True:
+            node_word, items, children = node
+            d = distance(word, node_word)
+            if d == 0:
+                items.append(item)
+                return
+            if d not in children:
+                children[d] = (word, [item], {})
+                return
+            node = children[d]
+
+    def search(self, word, threshold):
+        """Return all items whose word is within threshold edits of word."""
+        if self.root is None:
+            return []
+        from Levenshtein import distance
+        found = []
+        stack = [self.root]
+        while stack:
+            node_word, items, children = stack.pop()
+            d = distance(word, node_word)
+            if d <= threshold:
+                found.extend(items)
+            for child_distance, child in children.items():
+                if d - threshold <= child_distance <= d + threshold:
+                    stack.append(child)
+        return found
+
+def family_users_version(family_id):
+    """Name of the shared version bumped when a family's members change."""
+    return f'users{family_id}'
+
+class UserNameIndex:
+    """Per-process BK-trees of user names, one per family, each rebuilt when
+    its family's shared users version changes (bumped whenever a user of
+    that family is created or deleted)."""
+
+    def __init__(self):
+        self._trees = {}  # family_id -> (version, tree)
+        self._lock = threading.Lock()
+
+    def search(self, family_id, name, threshold):
+        """Return ids of the family's users whose name is within threshold edits of name."""
+        version = fragment_cache.version(family_users_version(family_id))
+        with self._lock:
+            entry = self._trees.get(family_id)
+            if entry is None or entry[0] != version:
+                tree = BKTree()
+                # Cached under the current version, so never build it from a lagging replica
+                with replica_reads(enabled=False):
+                    rows = db.session.execute(
+                        db.select(User.id, User.name).where(User.family_id == family_id)
+                    ).all()
+                for user_id, user_name in rows:
+                    tree.add(user_name.lower(), user_id)
+                entry = self._trees[family_id] = (version, tree)
+            return entry[1].search(name.lower(), threshold)
+
+user_name_index = UserNameIndex()
+
+def invalidate_user_index(family_id):
+    """Make every worker rebuild the family's user name index on the next lookup."""
+    fragment_cache.bump(family_users_version(family_id))
+
+class UserSnapshot(UserMixin):
+    """Detached, read-only copy of a User used as current_user."""
+
+    def __init__(self, id, name, family_id):
+        self.id = id
+        self.name = name
+        self.family_id = family_id
+
+class UserCache:
+    """Per-process LRU of user snapshots for the Flask-Login user loader.
+
+    Entries expire after USER_CACHE_TTL and whenever the user's family
+    version changes, so a deleted account stops resolving in every worker.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # user_id -> (expires_at, version, snapshot)
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0}
+
+    def stats(self):
+        """Return a copy of the hit/miss counters; hits are saved queries."""
+        with self._lock:
+            return dict(self._stats)
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+        # Users never change family, so even an expired entry says which version to check
+        version = fragment_cache.version(family_users_version(entry[2].family_id)) if entry else None
+        with self._lock:
+            if entry is not None and entry[0] >= time.time() and entry[1] == version:
+                if user_id in self._entries:
+                    self._entries.move_to_end(user_id)
+                self._stats['hits'] += 1
+                metrics.CACHE_LOOKUPS.labels(cache='user', result='hit').inc()
+                return entry[2]
+            self._stats['misses'] += 1
+        metrics.CACHE_LOOKUPS.labels(cache='user', result='miss').inc()
+
+        row = db.session.execute(
+            db.select(User.id, User.name, User.family_id).where(User.id == user_id)
+        ).first()
+        if row is None:
+            self.invalidate(user_id)
+            return None
+        if version is None:
+            version = fragment_cache.version(family_users_version(row.family_id))
+        snapshot = UserSnapshot(id=row.id, name=row.name, family_id=row.family_id)
+        with self._lock:
+            self._entries[user_id] = (time.time() + self.ttl, version, snapshot)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return snapshot
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+user_cache = UserCache(max_size=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+def dashboard_etag(viewer_id, family_id):
+    """Build a strong ETag for a family's dashboard from a single aggregate query.
+
+    User count and max id change when members join or leave, wish count and
+    the newest modification stamp change on every wish write. The newest
+    change id is embedded in the page for /changes, so a page kept by a 304
+    always resumes from the current one. All five are answered from the
+    family indexes, independent of other families.
+    """
+    row = db.session.execute(db.select(
+        db.select(db.func.count(User.id)).where(User.family_id == family_id).scalar_subquery(),
+        db.select(db.func.max(User.id)).where(User.family_id == family_id).scalar_subquery(),
+        db.select(db.func.count(Wish.id)).where(Wish.family_id == family_id).scalar_subquery(),
+        db.select(db.func.max(Wish.updated_at)).where(Wish.family_id == family_id).scalar_subquery(),
+        db.select(db.func.max(WishChange.id)).where(WishChange.family_id == family_id).scalar_subquery()
+    )).one()
+    state = ':'.join(str(value) for value in (DASHBOARD_TEMPLATE_VERSION, viewer_id) + tuple(row))
+    return hashlib.sha256(state.encode('utf-8')).hexdigest()[:32]
+
+def render_user_wishes(users, viewer_id):
+    """Render each user's wish card, reusing cached HTML where the
+    user's version is unchanged. Returns the fragments in user order."""
+    keys = {}
+    fragments = {}
+    for user in users:
+        role = 'owner' if user.id == viewer_id else 'viewer'
+        name = f'user{user.id}'
+        keys[user.id] = f'{name}:{fragment_cache.version(name)}:{FRAGMENT_TEMPLATE_VERSION}:{role}'
+        fragments[user.id] = fragment_cache.get(keys[user.id])
+
+    missing = [user_id for user_id, html in fragments.items() if html is None]
+    if missing:
+        # One query for the wishes of every user whose fragment is stale
+        wishes_by_user = {user_id: [] for user_id in missing}
+        # Cached under the current version, so never render from a lagging replica
+        with replica_reads(enabled=False):
+            wishes = (Wish.query.filter(Wish.user_id.in_(missing))
+                      .order_by(Wish.user_id, Wish.priority, Wish.id.desc()).all())
+        for wish in wishes:
+            wishes_by_user[wish.user_id].append(wish)
+        for user in users:
+            if user.id in wishes_by_user:
+                html = render_template('user_wishes.html', user=user,
+                                       wishes=wishes_by_user[user.id],
+                                       is_owner=user.id == viewer_id)
+                fragment_cache.set(keys[user.id], html)
+                fragments[user.id] = html
+
+    return [Markup(fragments[user.id]) for user in users]
+
+# Yielded into a streamed template to send everything rendered before it
+STREAM_FLUSH = Markup('')
+
+def buffered_stream(chunks):
+    """Join the chunks of a streamed template into one per STREAM_FLUSH.
+
+    Jinja yields every piece of text and every expression separately;
+    sending each on its own costs a write and a compressor flush apiece.
+    """
+    buffer = []
+    try:
+        for chunk in chunks:
+            if chunk:
+                buffer.append(chunk)
+            elif buffer:
+                yield ''.join(buffer)
+                buffer = []
+        if buffer:
+            yield ''.join(buffer)
+    finally:
+        # Lets stream_with_context tear down the request context
+        chunks.close()
+
+def wants_json():
+    """True if the client prefers a JSON response, e.g. a fetch() call."""
+    return request.accept_mimetypes.best == 'application/json'
+
+def wish_update_response(user, message, status=200):
+    """JSON answer for in-place dashboard updates, with the user's re-rendered card.
+
+    Errors are also flashed, since the page falls back to a reload to show them.
+    """
+    if status >= 400:
+        flash(message)
+    html = render_user_wishes([user], user.id)[0] if status < 400 else None
+    return jsonify({'ok': status < 400, 'message': message, 'user_id': user.id, 'html': html}), status
+
+def latest_change_id(family_id):
+    """Return the newest id in the family's change feed, 0 if it is empty."""
+    return db.session.execute(
+        db.select(db.func.max(WishChange.id)).where(WishChange.family_id == family_id)
+    ).scalar() or 0
+
+def read_changes(family_id, after_id):
+    """Return up to CHANGES_BATCH of the family's changes after after_id, oldest first.
+
+    Reads the primary directly: the session would route to the replica and
+    could mark the browser session as written from inside a stream.
+    """
+    with db.engine.connect() as conn:
+        return conn.execute(
+            db.select(WishChange.id, WishChange.kind, WishChange.user_id, WishChange.wish_id)
+            .where(WishChange.family_id == family_id, WishChange.id > after_id)
+            .order_by(WishChange.id).limit(CHANGES_BATCH)
+        ).all()
+
+def changes_pruned_after(family_id, after_id):
+    """True if changes of the family newer than after_id may have been pruned from the feed.
+
+    Pruning keeps each family's newest change, so a client that has seen it
+    has missed nothing, however long ago that was. Otherwise changes may be
+    missing if any id after after_id is gone; ids are shared by all families.
+    """
+    with db.engine.connect() as conn:
+        latest = conn.execute(
+            db.select(db.func.max(WishChange.id)).where(WishChange.family_id == family_id)
+        ).scalar()
+        if latest is None or latest <= after_id:
+            return False
+        oldest = conn.execute(db.select(db.func.min(WishChange.id))).scalar()
+    return after_id < oldest - 1
+
+_last_prune = 0.0
+
+def prune_changes():
+    """Delete changes older than CHANGES_RETENTION, at most once per CHANGES_PRUNE_INTERVAL per process.
+
+    Each family's newest change is kept, see changes_pruned_after.
+    """
+    global _last_prune
+    if time.monotonic() - _last_prune < CHANGES_PRUNE_INTERVAL:
+        return
+    _last_prune = time.monotonic()
+    cutoff = datetime.utcnow() - timedelta(seconds=CHANGES_RETENTION)
+    try:
+        with db.engine.begin() as conn:
+            newest = db.select(db.func.max(WishChange.id)).group_by(WishChange.family_id)
+            deleted = conn.execute(db.delete(WishChange).where(
+                WishChange.created_at < cutoff, WishChange.id.not_in(newest)
+            )).rowcount
+        if deleted:
+            logger.info(f"Pruned {deleted} old dashboard changes")
+    except SQLAlchemyError as e:
+        logger.warning(f"Pruning dashboard changes failed: {str(e)}")
+
+class ChangeNotifier:
+    """Per-process watcher of the change feed.
+
+    One background thread polls the newest change id of every family each
+    CHANGES_POLL_INTERVAL and wakes the streams waiting for that family, so
+    an idle stream costs no queries of its own.
+    """
+
+    def __init__(self, poll_interval):
+        self.poll_interval = poll_interval
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        # Started per worker: threads do not survive a fork, and under gevent
+        # the condition has to come from the patched threading module
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._latest = {}  # family_id -> newest change id
+            self._seen = 0  # The first poll reads the newest id of every family
+            self._condition = threading.Condition()
+            self._pid = os.getpid()
+            thread = threading.Thread(target=self._run, args=(current_app._get_current_object(),),
+                                      name='change-notifier', daemon=True)
+        thread.start()
+
+    def wait(self, family_id, after_id, timeout):
+        """Block until the family has a change after after_id; False on timeout."""
+        self._ensure_started()
+        with self._condition:
+            return self._condition.wait_for(lambda: self._latest.get(family_id, 0) > after_id, timeout)
+
+    def _run(self, app):
+        with app.app_context():
+            while True:
+                try:
+                    with db.engine.connect() as conn:
+                        rows = conn.execute(
+                            db.select(WishChange.family_id, db.func.max(WishChange.id))
+                            .where(WishChange.id > self._seen)
+                            .group_by(WishChange.family_id)
+                        ).all()
+                    if rows:
+                        with self._condition:
+                            for family_id, change_id in rows:
+                                self._latest[family_id] = change_id
+                                self._seen = max(self._seen, change_id)
+                            self._condition.notify_all()
+                except Exception as e:
+                    logger.warning(f"Polling dashboard changes failed: {str(e)}")
+                time.sleep(self.poll_interval)
+
+change_notifier = ChangeNotifier(poll_interval=CHANGES_POLL_INTERVAL)
+
+def read_import_rows(raw, upload):
+    """Turn pasted text or an uploaded JSON/CSV file into raw import rows.
+
+    Each row is a dict with the keys url, name and priority (all optional).
+    Raises ValueError if the upload cannot be parsed.
+    """
+    rows = []
+    if upload and upload.filename:
+        content = upload.read(IMPORT_MAX_BYTES + 1)
+        if len(content) > IMPORT_MAX_BYTES:
+            raise ValueError('Die Datei ist zu groß')
+        content = content.decode('utf-8-sig', errors='replace')
+        if upload.filename.lower().endswith('.json'):
+            try:
+                data = json.loads(content)
+            except json.JSONDecodeError as e:
+                raise ValueError(f'Ungültiges JSON: {e.msg}')
+            if not isinstance(data, list):
+                raise ValueError('JSON muss eine Liste sein')
+            for item in data:
+                rows.append(item if isinstance(item, dict) else {'url': item})
+        else:
+            reader = csv.reader(io.StringIO(content))
+            header = None
+            for record in reader:
+                if not record or not any(field.strip() for field in record):
+                    continue
+                if header is None and 'url' in [field.strip().lower() for field in record]:
+                    header = [field.strip().lower() for field in record]
+                    continue
+                if header:
+                    rows.append(dict(zip(header, record)))
                 else:
-                    # Fall back to first image
-                    first_img = soup.find('img', src=True)
-                    if first_img:
-                        img_src = first_img.get('src')
-                        if img_src:
-                            # Handle relative URLs
-                            if not img_src.startswith(('http://', 'https://')):
-                                base_url = '{uri.scheme}://{uri.netloc}'.format(uri=urlparse(self.url))
-                                img_src = urljoin(base_url, img_src)
-                            self.thumbnail_url = img_src
+                    rows.append(dict(zip(('url', 'name', 'priority'), record)))
+    for line in (raw or '').splitlines():
+        if line.strip():
+            rows.append({'url': line})
+    return rows
+
+def validate_import_row(row):
+    """Validate one import row and return the Wish fields for it.
+
+    Lines that are not http(s) URLs are imported as plain descriptions,
+    just like the single add form. Raises ValueError with a message for
+    the import report.
+    """
+    if not isinstance(row, dict):
+        raise ValueError('Ungültiger Eintrag')
+    url = str(row.get('url') or '').strip()
+    name = str(row.get('name') or '').strip()
+    priority = row.get('priority') or 2
+    try:
+        priority = int(priority)
+    except (TypeError, ValueError):
+        raise ValueError(f'Ungültige Priorität: {priority}')
+    if priority not in [p.value for p in Priority]:
+        raise ValueError(f'Ungültige Priorität: {priority}')
+
+    if urlparse(url).scheme not in ('http', 'https'):
+        # Not a URL: treat the text as a description
+        name = name or url
+        url = ''
+    elif not urlparse(url).netloc:
+        raise ValueError('Ungültige URL')
+    if not url and not name:
+        raise ValueError('Leerer Eintrag')
+    if len(url) > 2000:
+        raise ValueError('URL ist zu lang (max. 2000 Zeichen)')
+    if len(name) > 200:
+        raise ValueError('Beschreibung ist zu lang (max. 200 Zeichen)')
+    return {'url': url, 'name': name or None, 'priority': priority}
+
+def wish_url_hash(url):
+    """Return the url_hash for a new wish's URL, None for a plain description.
+
+    Short links the metadata cache has already resolved are hashed by their
+    target, so they match wishes added with the full URL.
+    """
+    if not url:
+        return None
+    if is_short_url(url):
+        metadata = metadata_cache.peek(url)
+        if metadata and metadata.get('url'):
+            return url_hash(metadata['url'])
+    return url_hash(url)
+
+def find_wishes_by_url_hash(family_id, hashes):
+    """Return a dict of url_hash -> the family's wishes with that hash, oldest first."""
+    hashes = {digest for digest in hashes if digest}
+    found = {}
+    if not hashes:
+        return found
+    wishes = (Wish.query.filter(Wish.family_id == family_id, Wish.url_hash.in_(hashes))
+              .options(joinedload(Wish.owner)).order_by(Wish.id))
+    for wish in wishes:
+        found.setdefault(wish.url_hash, []).append(wish)
+    return found
+
+def take_duplicate_metadata(wish, duplicates):
+    """Copy the details of an already fetched duplicate into wish.
+
+    Returns True if there was one, so the page need not be fetched again.
+    """
+    for other in duplicates:
+        if other.metadata_status == MetadataStatus.DONE.value:
+            wish.copy_metadata(other)
+            return True
+    return False
+
+def encode_cursor(wish):
+    """Encode the (priority, id) keyset position after a wish."""
+    return base64.urlsafe_b64encode(f'{wish.priority}:{wish.id}'.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Decode a cursor from encode_cursor; raises ValueError if malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        priority, wish_id = raw.split(':')
+        return int(priority), int(wish_id)
+    except (ValueError, UnicodeDecodeError, binascii.Error):
+        raise ValueError('Invalid cursor')
+
+def serialize_wish(wish, fields):
+    """Return the requested fields of a wish as a JSON-ready dict."""
+    data = {}
+    for field in fields:
+        value = getattr(wish, field)
+        data[field] = value.isoformat() if isinstance(value, datetime) else value
+    return data
 
+def search_wishes(family_id, query, page, per_page):
+    """Return one page of the family's wishes matching query, best first,
+    and whether there are more."""
+    statement = search_statement(db.engine.dialect.name, family_id, query,
+                                 limit=per_page + 1, offset=(page - 1) * per_page)
+    if statement is None:
+        return [], False
+    ids = [row.id for row in db.session.execute(statement)]
+    has_more = len(ids) > per_page
+    ids = ids[:per_page]
+    # One query for the wishes and their owners, then back into rank order
+    wishes = {wish.id: wish for wish in
+              Wish.query.filter(Wish.id.in_(ids)).options(joinedload(Wish.owner))}
+    return [wishes[wish_id] for wish_id in ids if wish_id in wishes], has_more
+
+def prepare_database(app):
+    """Create missing tables and report pending migrations."""
+    with app.app_context():
+        try:
+            fresh = not inspect(db.engine).has_table('wish')
+            db.create_all()
+            if fresh:
+                # The models already include every migration
+                migration_runner.stamp(db.engine)
+            logger.info("Database tables created successfully")
         except Exception as e:
-            logger.error(f"Error fetching metadata for {self.url}: {str(e)}")
-            # Ensure we at least have a name
-            if not self.name:
-                self.name = urlparse(self.url).netloc
+            logger.error(f"Error creating database tables: {str(e)}")
+            raise
+        pending = migration_runner.pending_migrations(db.engine)
+        if pending:
+            logger.warning(f"Pending database migrations: {', '.join(pending)}. "
+                           f"Run 'python -m migrations.runner' to apply them.")
+        if db.session.execute(db.select(Family.id).limit(1)).first() is None:
+            # The first family is joined with the deployment-wide INVITE_TOKEN
+            try:
+                family = create_family('Familie', os.environ.get('INVITE_TOKEN'))
+                logger.info(f"Created default family with invite token {family.invite_token}")
+            except IntegrityError:
+                db.session.rollback()  # Created concurrently by another process
+
+def create_family(name, invite_token=None):
+    """Create a family with the given or a random invite token."""
+    family = Family(name=name, invite_token=invite_token or secrets.token_urlsafe(16))
+    db.session.add(family)
+    db.session.commit()
+    return family
 
 def create_app():
     app = Flask(__name__)
@@ -217,8 +1633,7 @@ def create_app():
             'pool_pre_ping': True,  # Enable connection health checks
             'pool_timeout': 30,     # Connection timeout in seconds
             'max_overflow': 10,     # Allow up to 10 connections over pool_size
-            'echo': True,           # Log all SQL statements in development
-            'echo_pool': True       # Log connection pool events
+            'poolclass': InstrumentedQueuePool  # Records checkout waits
         }
     else:
         # Use SQLite locally
@@ -226,9 +1641,15 @@ def create_app():
         # SQLite-specific settings
         app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
             'pool_pre_ping': True,
-            'echo': True
+            'poolclass': InstrumentedQueuePool
         }
     
+    if REPLICA_DATABASE_URL:
+        # Read-only copy of the database for replica_reads() blocks
+        app.config['SQLALCHEMY_BINDS'] = {
+            'replica': dict(app.config['SQLALCHEMY_ENGINE_OPTIONS'], url=REPLICA_DATABASE_URL)
+        }
+
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
     # Initialize extensions with app
@@ -236,53 +1657,85 @@ def create_app():
     login_manager.init_app(app)
     login_manager.login_view = 'invite'
 
-    # Create tables within app context
+    if SCHEMA_CHECK == 'app':
+        prepare_database(app)
+
     with app.app_context():
-        try:
-            db.create_all()
-            logger.info("Database tables created successfully")
-        except Exception as e:
-            logger.error(f"Error creating database tables: {str(e)}")
-            raise
+        # No-op if the gunicorn master already runs the monitor
+        start_monitor(db.engine.url.render_as_string(hide_password=False))
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+            query_log.attach(engine)
 
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        with replica_reads():
+            return user_cache.get(int(user_id))
+
+    def family_for_token(token):
+        """Return the family whose invite token this is, or None."""
+        if not token:
+            return None
+        return Family.query.filter_by(invite_token=token).first()
 
     def check_invite_token():
         # Skip token check in development
         if not os.environ.get('DATABASE_URL'):  # We're in local development
             return True
-        token = request.args.get('token')
-        return token == os.environ.get('INVITE_TOKEN', 'your-secret-token-change-in-production')
+        return family_for_token(request.args.get('token')) is not None
+
+    def find_similar_users(family_id, name, threshold=2):
+        """Find members of a family with similar names using Levenshtein distance."""
+        user_ids = user_name_index.search(family_id, name, threshold)
+        if not user_ids:
+            return []
+        with replica_reads():
+            return User.query.filter(User.id.in_(user_ids)).order_by(User.id).all()
+
+    @app.after_request
+    def compress(response):
+        # Registered first, so it runs after all other after_request hooks
+        return compress_response(response, request.accept_encodings)
 
-    def find_similar_users(name, threshold=2):
-        """Find users with similar names using Levenshtein distance."""
-        similar_users = []
-        all_users = User.query.all()
-        for user in all_users:
-            if distance(name.lower(), user.name.lower()) <= threshold:
-                similar_users.append(user)
-        return similar_users
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request_metrics(response):
+        if 'request_started' in g:
+            endpoint = request.endpoint or 'none'
+            metrics.REQUEST_LATENCY.labels(endpoint=endpoint, method=request.method,
+                                           status=response.status_code) \
+                .observe(time.perf_counter() - g.request_started)
+            metrics.REQUEST_SQL_QUERIES.labels(endpoint=endpoint).observe(g.get('sql_queries', 0))
+            metrics.REQUEST_SQL_SECONDS.labels(endpoint=endpoint).observe(g.get('sql_seconds', 0.0))
+        return response
 
     @app.before_request
     def check_access():
-        # Skip check for static files and error pages
-        if request.path.startswith('/static/') or request.endpoint in ['error', 'static']:
+        # Skip check for static files, error pages and the metrics scrape
+        if request.path.startswith('/static/') or request.endpoint in ['error', 'static', 'metrics_endpoint']:
             return
 
         # Skip token check for invite page
         if request.endpoint == 'invite':
             return
 
+        # Shed load while the health monitor reports the database as down.
+        # This only reads a shared flag, no connection is touched.
+        if not circuit_breaker.allow_request():
+            return database_unavailable()
+
         try:
-            if not check_db_connection():
-                logger.error("Database connection check failed")
-                return render_template('error.html'), 503
-            
             # If user is authenticated, they can access any page
             if current_user.is_authenticated:
                 return
+
+            # API clients get an error instead of the invite page
+            if request.path.startswith('/api/'):
+                return jsonify({'error': 'Not logged in'}), 401
                 
             # For login page, only check token if it's a GET request
             if request.endpoint == 'login' and request.method == 'POST':
@@ -294,7 +1747,13 @@ def create_app():
                 
         except Exception as e:
             logger.error(f"Error in check_access: {str(e)}")
-            return render_template('error.html'), 503
+            return database_unavailable()
+
+    def database_unavailable():
+        # db_unavailable keeps base.html from loading current_user
+        response = make_response(render_template('error.html', db_unavailable=True), 503)
+        response.headers['Retry-After'] = str(BREAKER_COOLDOWN)
+        return response
 
     @app.errorhandler(500)
     def internal_error(error):
@@ -307,6 +1766,25 @@ def create_app():
         logger.error(f"Service unavailable: {str(error)}")
         return render_template('error.html'), 503
 
+    @app.cli.command('create-family')
+    @click.argument('name')
+    def create_family_command(name):
+        """Create a family and print its invite link."""
+        family = create_family(name)
+        click.echo(f"{family.name}: /login?token={family.invite_token}")
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        # Disabled unless a scrape token is configured
+        token = os.environ.get('METRICS_TOKEN')
+        if not token:
+            abort(404)
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            abort(401)
+        metrics.DB_BREAKER_STATE.set(circuit_breaker.state)
+        body, content_type = metrics.render_latest()
+        return app.response_class(body, content_type=content_type)
+
     @app.route('/')
     def index():
         # If user is logged in, go to dashboard
@@ -314,7 +1792,7 @@ def create_app():
             return redirect(url_for('dashboard'))
         # If user has token, go to login
         token = request.args.get('token')
-        if token and token == os.environ.get('INVITE_TOKEN'):
+        if family_for_token(token):
             return redirect(url_for('login', token=token))
         # Otherwise go to invite page
         return redirect(url_for('invite'))
@@ -323,7 +1801,7 @@ def create_app():
     def invite():
         # If user already has valid token, go to login
         token = request.args.get('token')
-        if token and token == os.environ.get('INVITE_TOKEN'):
+        if family_for_token(token):
             return redirect(url_for('login', token=token))
         # Otherwise show invite page
         return render_template('invite.html')
@@ -334,13 +1812,17 @@ def create_app():
         if current_user.is_authenticated:
             return redirect(url_for('dashboard'))
             
-        # On GET request, verify token
+        # On GET request, verify token and remember which family it invites to
         if request.method == 'GET':
-            token = request.args.get('token')
-            if not token or token != os.environ.get('INVITE_TOKEN'):
+            family = family_for_token(request.args.get('token'))
+            if family is None:
                 return redirect(url_for('invite'))
+            session['family_id'] = family.id
 
         if request.method == 'POST':
+            family_id = session.get('family_id')
+            if family_id is None:
+                return redirect(url_for('invite'))
             name = request.form.get('name')
             existing_user_id = request.form.get('existing_user')
             
@@ -349,23 +1831,29 @@ def create_app():
                 return redirect(url_for('login'))
             
             if existing_user_id:
-                # User chose to log in as existing user
-                user = User.query.get(existing_user_id)
-                if user:
+                # User chose to log in as existing user of the invited family
+                user = db.session.get(User, int(existing_user_id)) if existing_user_id.isdigit() else None
+                if user and user.family_id == family_id:
                     login_user(user)
                     return redirect(url_for('dashboard'))
+                if not name:
+                    flash('Please enter your name')
+                    return redirect(url_for('login'))
                 
             # Check for similar usernames
-            similar_users = find_similar_users(name)
+            similar_users = find_similar_users(family_id, name)
             if similar_users and 'confirm_new_user' not in request.form:
                 # Show confirmation page with similar users
                 return render_template('login.html', similar_users=similar_users, attempted_name=name)
             
             # If user confirmed new account or no similar users found
             if 'confirm_new_user' in request.form or not similar_users:
-                user = User(name=name)
+                user = User(name=name, family_id=family_id)
                 db.session.add(user)
+                db.session.flush()
+                record_change(family_id, user.id, ChangeKind.USER_ADDED)
                 db.session.commit()
+                invalidate_user_index(family_id)
                 login_user(user)
                 return redirect(url_for('dashboard'))
                 
@@ -373,14 +1861,115 @@ def create_app():
 
     @app.route('/dashboard')
     @login_required
+    @read_replica
     def dashboard():
-        users = User.query.all()
-        # Sort wishes by priority for each user
-        for user in users:
-            user.wishes.sort(key=lambda w: (w.priority, -w.id))  # Sort by priority, then newest first
-        return render_template('dashboard.html', 
-                             users=users,
-                             priorities=[(p.value, p.name, Priority.get_label(p.value)) for p in Priority])
+        requeue_stale_metadata()
+        # Answer revalidations without loading rows or rendering, unless
+        # there are flashed messages that still need to be shown
+        etag = dashboard_etag(current_user.id, current_user.family_id)
+        # Compressed responses carry the ETag as a weak validator
+        if '_flashes' not in session and request.if_none_match.contains_weak(etag):
+            response = app.response_class(status=304)
+        else:
+            users = User.query.filter_by(family_id=current_user.family_id).order_by(User.id).all()
+            viewer = [user for user in users if user.id == current_user.id]
+            others = [user for user in users if user.id != current_user.id]
+
+            def user_fragments():
+                # The page up to the current user's own list is sent before
+                # the other lists are rendered. Wishes are only loaded for
+                # users whose cached fragment is stale.
+                yield STREAM_FLUSH
+                yield from render_user_wishes(viewer, current_user.id)
+                yield STREAM_FLUSH
+                yield from render_user_wishes(others, current_user.id)
+
+            # The session is saved before the body streams, so take the
+            # flashed messages out of it now; the template gets them from
+            # the request context
+            get_flashed_messages()
+            response = app.response_class(buffered_stream(stream_template('dashboard.html',
+                                 user_fragments=user_fragments(),
+                                 changes_since=latest_change_id(current_user.family_id),
+                                 priorities=[(p.value, p.name, Priority.get_label(p.value)) for p in Priority])))
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+
+    @app.route('/changes')
+    @login_required
+    def changes():
+        """Stream changes to the family's dashboard as server-sent events.
+
+        Clients resume after the Last-Event-ID header or the since parameter.
+        Each event names the user whose card changed, which the page then
+        fetches from user_fragment. The stream ends after CHANGES_STREAM_SECONDS
+        (at once with 0) and the browser reconnects CHANGES_RETRY seconds later.
+        """
+        since = request.headers.get('Last-Event-ID') or request.args.get('since', '')
+        if not since.isdigit():
+            return jsonify({'error': 'Invalid since'}), 400
+        family_id = current_user.family_id
+        prune_changes()
+
+        def generate():
+            last_id = int(since)
+            yield f'retry: {CHANGES_RETRY * 1000}\n\n'
+            if changes_pruned_after(family_id, last_id):
+                # Offline for longer than the feed is kept
+                yield 'event: reload\ndata: {}\n\n'
+                return
+            deadline = time.monotonic() + CHANGES_STREAM_SECONDS
+            while True:
+                rows = read_changes(family_id, last_id)
+                for row in rows:
+                    yield f'id: {row.id}\ndata: {json.dumps(dict(row._mapping))}\n\n'
+                    last_id = row.id
+                if len(rows) == CHANGES_BATCH:
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not circuit_breaker.allow_request():
+                    return
+                if not change_notifier.wait(family_id, last_id, min(remaining, CHANGES_HEARTBEAT)):
+                    # Keeps proxies from closing an idle connection
+                    yield ': keep-alive\n\n'
+
+        response = app.response_class(stream_with_context(generate()), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'  # Don't let nginx buffer the stream
+        return response
+
+    @app.route('/fragments/users/<int:user_id>')
+    @login_required
+    @read_replica
+    def user_fragment(user_id):
+        """Return one user's dashboard card, for patching the page after a change."""
+        user = db.session.get(User, user_id)
+        if user is None or user.family_id != current_user.family_id:
+            abort(404)
+        response = make_response(render_user_wishes([user], current_user.id)[0])
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+
+    @app.route('/thumbnails/<digest>.webp')
+    @login_required
+    def thumbnail(digest):
+        if not re.fullmatch(r'[0-9a-f]{64}', digest):
+            abort(404)
+        if thumbnail_store.exists(digest):
+            thumbnail_store.touch(digest)
+            response = send_file(thumbnail_store.path(digest), mimetype='image/webp',
+                                 max_age=THUMBNAIL_MAX_AGE, conditional=True)
+            # Content-addressed, so the response for this URL can never change
+            response.headers['Cache-Control'] = f'private, max-age={THUMBNAIL_MAX_AGE}, immutable'
+            return response
+
+        # Evicted or cached on another host: serve the original and re-cache it
+        wish = Wish.query.filter_by(family_id=current_user.family_id, thumbnail_hash=digest).first()
+        if wish is None or not wish.thumbnail_url:
+            abort(404)
+        enqueue_thumbnail_fetch(wish.id)
+        return redirect(wish.thumbnail_url)
 
     @app.route('/add_wish', methods=['POST'])
     @login_required
@@ -395,30 +1984,49 @@ def create_app():
             return redirect(url_for('dashboard'))
             
         try:
+            duplicates = []
             # If URL is provided, create wish with URL and optional name
             if url:
+                digest = wish_url_hash(url)
+                duplicates = find_wishes_by_url_hash(current_user.family_id, [digest]).get(digest, [])
+                if any(wish.user_id == current_user.id for wish in duplicates):
+                    flash('Diesen Wunsch hast du schon auf deiner Liste')
+                    return redirect(url_for('dashboard'))
                 new_wish = Wish(
                     url=url,
+                    url_hash=digest,
                     name=name if name else None,  # Only set name if provided
                     priority=priority,
-                    user_id=current_user.id
+                    user_id=current_user.id,
+                    family_id=current_user.family_id,
+                    # Fetch metadata in the background if no name provided
+                    metadata_status=MetadataStatus.DONE.value if name else MetadataStatus.PENDING.value
                 )
-                # Fetch metadata if no name provided
-                if not name:
-                    new_wish.fetch_metadata()
+                # Another family member wishes for the same thing; reuse its details
+                take_duplicate_metadata(new_wish, duplicates)
             # If no URL, create wish with just the description
             else:
                 new_wish = Wish(
                     url='',
                     name=input_text,
                     priority=priority,
-                    user_id=current_user.id
+                    user_id=current_user.id,
+                    family_id=current_user.family_id
                 )
             
             db.session.add(new_wish)
+            db.session.flush()
+            record_change(current_user.family_id, current_user.id, ChangeKind.WISH_ADDED, new_wish.id)
             db.session.commit()
+            invalidate_user_fragments(current_user.id)
+
+            if new_wish.metadata_pending:
+                enqueue_metadata_fetch(new_wish.id)
             
             flash('Wunsch wurde hinzugefügt!')
+            if duplicates:
+                names = ', '.join(sorted({wish.owner.name for wish in duplicates}))
+                flash(f'{names} wünscht sich das auch')
             
         except Exception as e:
             logger.error(f"Error adding wish: {str(e)}")
@@ -427,49 +2035,238 @@ def create_app():
             
         return redirect(url_for('dashboard'))
 
+    @app.route('/import_wishes', methods=['GET', 'POST'])
+    @login_required
+    def import_wishes():
+        if request.method == 'GET':
+            return render_template('import.html')
+
+        try:
+            rows = read_import_rows(request.form.get('urls'), request.files.get('file'))
+        except ValueError as e:
+            flash(str(e))
+            return render_template('import.html'), 400
+        if not rows:
+            flash('Bitte füge URLs ein oder lade eine Datei hoch')
+            return render_template('import.html'), 400
+        if len(rows) > IMPORT_MAX_ROWS:
+            flash(f'Es können höchstens {IMPORT_MAX_ROWS} Wünsche auf einmal importiert werden')
+            return render_template('import.html'), 400
+
+        # Validate everything first, then insert all valid rows in one transaction
+        results = []
+        new_wishes = []
+        validated = []
+        for line, row in enumerate(rows, start=1):
+            label = row.get('url') or row.get('name') if isinstance(row, dict) else row
+            try:
+                fields = validate_import_row(row)
+            except ValueError as e:
+                results.append({'line': line, 'input': str(label or ''), 'status': 'error', 'message': str(e)})
+                continue
+            validated.append((line, label, fields, wish_url_hash(fields['url'])))
+
+        # One indexed lookup for all URLs of the batch
+        existing = find_wishes_by_url_hash(current_user.family_id, [digest for *_, digest in validated])
+        own_hashes = {digest for digest, wishes in existing.items()
+                      if any(wish.user_id == current_user.id for wish in wishes)}
+        for line, label, fields, digest in validated:
+            if digest in own_hashes:
+                results.append({'line': line, 'input': str(label or ''), 'status': 'duplicate',
+                                'message': 'Schon auf deiner Liste'})
+                continue
+            if digest:
+                own_hashes.add(digest)  # Later lines with the same URL are duplicates too
+            wish = Wish(
+                user_id=current_user.id,
+                family_id=current_user.family_id,
+                url_hash=digest,
+                metadata_status=MetadataStatus.PENDING.value if fields['url'] and not fields['name'] else MetadataStatus.DONE.value,
+                **fields
+            )
+            take_duplicate_metadata(wish, existing.get(digest, []))
+            new_wishes.append(wish)
+            results.append({'line': line, 'input': str(label or ''), 'status': 'added', 'wish': wish})
+
+        if new_wishes:
+            try:
+                db.session.add_all(new_wishes)
+                db.session.flush()
+                for wish in new_wishes:
+                    record_change(current_user.family_id, current_user.id, ChangeKind.WISH_ADDED, wish.id)
+                db.session.commit()
+            except Exception as e:
+                logger.error(f"Error importing wishes: {str(e)}")
+                db.session.rollback()
+                flash('Fehler beim Importieren der Wünsche')
+                return render_template('import.html'), 500
+            invalidate_user_fragments(current_user.id)
+            # Metadata for the batch is fetched concurrently by the bounded executor
+            for wish in new_wishes:
+                if wish.metadata_pending:
+                    enqueue_metadata_fetch(wish.id)
+
+        results.sort(key=lambda result: result['line'])
+        for result in results:
+            wish = result.pop('wish', None)
+            if wish is not None:
+                result['wish_id'] = wish.id
+                result['message'] = 'Details werden geladen' if wish.metadata_pending else ''
+
+        added = len(new_wishes)
+        if wants_json():
+            return jsonify({'added': added, 'failed': len(results) - added, 'rows': results})
+        flash(f'{added} von {len(results)} Wünschen importiert')
+        return render_template('import.html', results=results)
+
+    @app.route('/api/users')
+    @login_required
+    @read_replica
+    def api_users():
+        users = db.session.execute(
+            db.select(User.id, User.name).where(User.family_id == current_user.family_id).order_by(User.id)
+        ).all()
+        return jsonify({'users': [{'id': user.id, 'name': user.name} for user in users]})
+
+    @app.route('/api/users/<int:user_id>/wishes')
+    @login_required
+    @read_replica
+    def api_user_wishes(user_id):
+        """Page through a user's wishes in dashboard order (priority, newest first).
+
+        Query parameters: limit, cursor (next_cursor of the previous page) and
+        fields (comma-separated subset of API_WISH_FIELDS).
+        """
+        user = db.session.get(User, user_id)
+        if user is None or user.family_id != current_user.family_id:
+            return jsonify({'error': 'User not found'}), 404
+
+        fields = API_WISH_FIELDS
+        if request.args.get('fields'):
+            fields = tuple(field.strip() for field in request.args['fields'].split(',') if field.strip())
+            unknown = [field for field in fields if field not in API_WISH_FIELDS]
+            if unknown:
+                return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+        limit = request.args.get('limit', API_PAGE_SIZE, type=int)
+        limit = max(1, min(limit, API_MAX_PAGE_SIZE))
+
+        # Only load the selected columns; id and priority are needed for the cursor
+        columns = {'id', 'priority'} | set(fields)
+        query = (Wish.query.filter(Wish.user_id == user_id)
+                 .options(load_only(*[getattr(Wish, column) for column in columns]))
+                 .order_by(Wish.priority, Wish.id.desc()))
+        if request.args.get('cursor'):
+            try:
+                priority, wish_id = decode_cursor(request.args['cursor'])
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            query = query.filter(db.or_(Wish.priority > priority,
+                                        db.and_(Wish.priority == priority, Wish.id < wish_id)))
+
+        # Fetch one extra row to know whether there is a next page
+        wishes = query.limit(limit + 1).all()
+        next_cursor = encode_cursor(wishes[limit - 1]) if len(wishes) > limit else None
+        return jsonify({
+            'wishes': [serialize_wish(wish, fields) for wish in wishes[:limit]],
+            'next_cursor': next_cursor
+        })
+
+    @app.route('/search')
+    @login_required
+    @read_replica
+    def search():
+        query = request.args.get('q', '').strip()
+        page = max(1, request.args.get('page', 1, type=int))
+        wishes, has_more = search_wishes(current_user.family_id, query, page, SEARCH_PAGE_SIZE)
+        return render_template('search.html', query=query, wishes=wishes, page=page, has_more=has_more)
+
+    @app.route('/api/search')
+    @login_required
+    @read_replica
+    def api_search():
+        """Search the family's wishes by name, URL and description, best match first.
+
+        Query parameters: q, page (1-based) and limit.
+        """
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({'error': 'Missing q'}), 400
+        page = max(1, request.args.get('page', 1, type=int))
+        limit = max(1, min(request.args.get('limit', SEARCH_PAGE_SIZE, type=int), API_MAX_PAGE_SIZE))
+        wishes, has_more = search_wishes(current_user.family_id, query, page, limit)
+        return jsonify({
+            'wishes': [dict(serialize_wish(wish, API_WISH_FIELDS), user_id=wish.user_id,
+                            user_name=wish.owner.name) for wish in wishes],
+            'next_page': page + 1 if has_more else None
+        })
+
     @app.route('/update_priority/<int:wish_id>', methods=['POST'])
     @login_required
     def update_priority(wish_id):
+        """Change a wish's priority. Answers fetch() calls asking for JSON
+        with the owner's re-rendered card instead of a redirect."""
         wish = Wish.query.get_or_404(wish_id)
         if wish.user_id != current_user.id:
+            if wants_json():
+                return wish_update_response(current_user, 'You can only update your own wishes', 403)
             flash('You can only update your own wishes')
             return redirect(url_for('dashboard'))
 
+        new_priority = request.form.get('priority')
+        if not (new_priority and new_priority.isdigit()):
+            if wants_json():
+                return wish_update_response(current_user, 'Invalid priority', 400)
+            return redirect(url_for('dashboard'))
+
         try:
-            new_priority = request.form.get('priority')
-            if new_priority and new_priority.isdigit():
-                wish.priority = int(new_priority)
-                db.session.commit()
-                flash('Priority updated successfully!')
+            wish.priority = int(new_priority)
+            record_change(wish.family_id, wish.user_id, ChangeKind.WISH_UPDATED, wish.id)
+            db.session.commit()
+            invalidate_user_fragments(current_user.id)
+            message, status = 'Priority updated successfully!', 200
         except Exception as e:
-            flash('Error updating priority. Please try again.')
+            db.session.rollback()
+            message, status = 'Error updating priority. Please try again.', 500
             logger.error(f"Error updating priority: {str(e)}")
 
+        if wants_json():
+            return wish_update_response(current_user, message, status)
+        flash(message)
         return redirect(url_for('dashboard'))
 
     @app.route('/delete_wish/<int:wish_id>', methods=['POST'])
     @login_required
     def delete_wish(wish_id):
+        """Delete a wish; JSON clients get the owner's re-rendered card."""
         wish = Wish.query.get_or_404(wish_id)
         if wish.user_id == current_user.id:
             def _delete_wish():
                 db.session.delete(wish)
+                record_change(wish.family_id, wish.user_id, ChangeKind.WISH_DELETED, wish.id)
                 db.session.commit()
             
             try:
                 retry_db_operation(_delete_wish)
-                flash('Wish deleted successfully')
+                invalidate_user_fragments(current_user.id)
+                message, status = 'Wish deleted successfully', 200
             except Exception as e:
-                flash('Error deleting wish. Please try again.')
+                message, status = 'Error deleting wish. Please try again.', 500
                 logger.error(f"Error deleting wish: {str(e)}")
         else:
-            flash('You cannot delete this wish')
+            message, status = 'You cannot delete this wish', 403
+        if wants_json():
+            return wish_update_response(current_user, message, status)
+        flash(message)
         return redirect(url_for('dashboard'))
 
     @app.route('/delete_account', methods=['POST'])
     @login_required
     def delete_account():
-        current_user.delete_account()
+        user_id, family_id = current_user.id, current_user.family_id
+        db.session.get(User, user_id).delete_account()
+        user_cache.invalidate(user_id)
+        invalidate_user_fragments(user_id)
+        invalidate_user_index(family_id)
         logout_user()
         flash('Your account has been deleted')
         return redirect(url_for('index'))
@@ -477,10 +2274,10 @@ def create_app():
     @app.route('/logout')
     @login_required
     def logout():
+        family = db.session.get(Family, current_user.family_id)
         logout_user()
-        # Redirect to login page with token
-        token = os.environ.get('INVITE_TOKEN', '')
-        return redirect(url_for('login', token=token))
+        # Redirect to the family's login page
+        return redirect(url_for('login', token=family.invite_token if family else None))
 
     return app
 
@@ -488,6 +2285,4 @@ def create_app():
 app = create_app()
 
 if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,458 @@
+"""Reproducible load and latency benchmark for the wishlist app.
+
+Seeds a fresh SQLite database with synthetic families, starts a local stub
+shop server and drives /login, /dashboard, /add_wish and /update_priority
+through the Flask test client and/or a real gunicorn started with
+gunicorn.conf.py. Reports p50/p95/p99 latency, throughput, SQL statements
+per request and peak RSS (plus the dashboard's time to first byte and
+transfer size over HTTP), and compares against a saved baseline.
+
+Usage:
+    python benchmarks/benchmark.py --users 20 --wishes 15
+    python benchmarks/benchmark.py --mode both --save-baseline baseline.json
+    python benchmarks/benchmark.py --mode both --baseline baseline.json
+"""
+
+import argparse
+import json
+import os
+import resource
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from stub_shop import StubShop
+
+INVITE_TOKEN = 'benchmark'
+SCENARIOS = ('login', 'dashboard', 'dashboard_revalidate', 'update_priority', 'update_priority_json',
+             'add_wish')
+METRICS = ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps', 'queries_per_request')
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--mode', choices=('client', 'gunicorn', 'both'), default='client')
+    parser.add_argument('--users', type=int, default=20, help='family members to seed')
+    parser.add_argument('--families', type=int, default=1,
+                        help='families of that size to seed; only the first one is driven')
+    parser.add_argument('--wishes', type=int, default=15, help='wishes per family member')
+    parser.add_argument('--url-length', type=int, default=300, help='length of seeded wish URLs')
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=4, help='client threads in gunicorn mode')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--shop-latency', type=float, default=0.1, help='stub shop delay in seconds')
+    parser.add_argument('--shop-page-size', type=int, default=200 * 1024, help='stub shop page bytes')
+    parser.add_argument('--output', help='write the JSON report to this file')
+    parser.add_argument('--save-baseline', metavar='PATH', help='save this run as baseline')
+    parser.add_argument('--baseline', metavar='PATH', help='compare against a saved baseline')
+    return parser.parse_args()
+
+def configure_environment(workdir):
+    """Point the app at a scratch database and cache directories."""
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'benchmark.db')}"
+    os.environ['INVITE_TOKEN'] = INVITE_TOKEN
+    os.environ['SECRET_KEY'] = 'benchmark'
+    os.environ['FRAGMENT_CACHE_DIR'] = os.path.join(workdir, 'fragments')
+    os.environ['THUMBNAIL_CACHE_DIR'] = os.path.join(workdir, 'thumbnails')
+
+def product_url(shop, number, length):
+    url = f'{shop.url}/product/{number}?ref='
+    return url + 'x' * max(0, length - len(url))
+
+def seed(app, db, shop, args):
+    """Insert families x users x wishes rows with long URLs through Core executemany.
+
+    The first family is the default one joined with INVITE_TOKEN; its user
+    ids are returned. Further families only add rows the app must not read.
+    """
+    from app import User, Wish, MetadataStatus, create_family, Family
+    from urls import url_hash
+    with app.app_context():
+        family_ids = [db.session.execute(db.select(db.func.min(Family.id))).scalar()]
+        family_ids += [create_family(f'Benchmark Family {n}').id for n in range(1, args.families)]
+        db.session.execute(db.insert(User), [
+            {'name': f'Benchmark User {i}', 'family_id': family_id}
+            for family_id in family_ids for i in range(args.users)
+        ])
+        users = db.session.execute(db.select(User.id, User.family_id).order_by(User.id)).all()
+        rows = []
+        for user_id, family_id in users:
+            for j in range(args.wishes):
+                number = len(rows)
+                url = product_url(shop, number, args.url_length)
+                rows.append({
+                    'user_id': user_id,
+                    'family_id': family_id,
+                    'url': url,
+                    'url_hash': url_hash(url),
+                    'name': f'Produkt {number}',
+                    'thumbnail_url': f'{shop.url}/image/{number}.jpg',
+                    'priority': j % 3 + 1,
+                    'metadata_status': MetadataStatus.DONE.value
+                })
+        if rows:
+            db.session.execute(db.insert(Wish), rows)
+        db.session.commit()
+        return [user_id for user_id, family_id in users if family_id == family_ids[0]]
+
+def summarize(latencies, elapsed, queries=None, errors=0):
+    """Latency percentiles in ms, throughput and average SQL statements."""
+    if len(latencies) > 1:
+        cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    else:
+        p50 = p95 = p99 = latencies[0] if latencies else 0.0
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': round(p50 * 1000, 3),
+        'p95_ms': round(p95 * 1000, 3),
+        'p99_ms': round(p99 * 1000, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None
+    }
+
+class Actor:
+    """One logged-in family member issuing the scenario requests."""
+
+    def __init__(self, send, send_anonymous, user_id, user_name, wish_ids, shop, url_length):
+        self.send = send  # (method, path, data, headers) -> (status, headers)
+        self.send_anonymous = send_anonymous  # Same, without the login session
+        self.user_id = user_id
+        self.user_name = user_name
+        self.wish_ids = wish_ids
+        self.shop = shop
+        self.url_length = url_length
+        self.etag = None
+        self.counter = 0
+
+    def login(self):
+        self.send('GET', f'/login?token={INVITE_TOKEN}', None, {})
+        self.send_anonymous('GET', f'/login?token={INVITE_TOKEN}', None, {})
+        status, _ = self.send('POST', '/login', {'existing_user': str(self.user_id)}, {})
+        if status != 302:
+            raise RuntimeError(f'Login as user {self.user_id} failed with {status}')
+
+    def run(self, scenario):
+        """Issue one request for a scenario and return its status code."""
+        self.counter += 1
+        if scenario == 'login':
+            # Name lookup path: an existing name shows the similar-users page
+            status, _ = self.send_anonymous('POST', '/login', {'name': self.user_name}, {})
+            return status
+        if scenario == 'dashboard':
+            status, headers = self.send('GET', '/dashboard', None, {})
+            self.etag = headers.get('ETag', self.etag)
+            return status
+        if scenario == 'dashboard_revalidate':
+            status, _ = self.send('GET', '/dashboard', None,
+                                  {'If-None-Match': self.etag} if self.etag else {})
+            return status
+        if scenario == 'update_priority':
+            wish_id = self.wish_ids[self.counter % len(self.wish_ids)]
+            status, _ = self.send('POST', f'/update_priority/{wish_id}',
+                                  {'priority': str(self.counter % 3 + 1)}, {})
+            return status
+        if scenario == 'update_priority_json':
+            # In-place update from the dashboard script; no redirect or full page
+            wish_id = self.wish_ids[self.counter % len(self.wish_ids)]
+            status, _ = self.send('POST', f'/update_priority/{wish_id}',
+                                  {'priority': str(self.counter % 3 + 1)}, {'Accept': 'application/json'})
+            return status
+        if scenario == 'add_wish':
+            url = product_url(self.shop, 100000 + self.counter * 1000 + self.user_id, self.url_length)
+            status, _ = self.send('POST', '/add_wish', {'input': url, 'url': url}, {})
+            return status
+        raise ValueError(scenario)
+
+def wish_ids_for(app, db, user_id):
+    from app import Wish
+    with app.app_context():
+        return db.session.execute(
+            db.select(Wish.id).where(Wish.user_id == user_id).order_by(Wish.id)
+        ).scalars().all()
+
+def run_client_mode(app, db, shop, user_ids, args):
+    """Drive the app in-process through the Flask test client."""
+    client = app.test_client()
+    anonymous_client = app.test_client()
+
+    def send(method, path, data, headers, client=client):
+        response = client.open(path, method=method, data=data, headers=headers)
+        return response.status_code, response.headers
+
+    def send_anonymous(method, path, data, headers):
+        return send(method, path, data, headers, client=anonymous_client)
+
+    with app.app_context():
+        engine = db.engine
+    main_thread = threading.get_ident()
+    statement_count = [0]
+
+    def count_statement(*_):
+        # Background enrichment threads also run SQL; only count the request's
+        if threading.get_ident() == main_thread:
+            statement_count[0] += 1
+
+    from sqlalchemy import event
+    event.listen(engine, 'before_cursor_execute', count_statement)
+
+    actor = Actor(send, send_anonymous, user_ids[0], 'Benchmark User 0', wish_ids_for(app, db, user_ids[0]),
+                  shop, args.url_length)
+    actor.login()
+    actor.run('dashboard')  # Warm up template and fragment caches
+
+    results = {}
+    for scenario in SCENARIOS:
+        latencies, queries, errors = [], [], 0
+        started = time.perf_counter()
+        for _ in range(args.requests):
+            statement_count[0] = 0
+            request_started = time.perf_counter()
+            status = actor.run(scenario)
+            latencies.append(time.perf_counter() - request_started)
+            queries.append(statement_count[0])
+            errors += status >= 400
+        results[scenario] = summarize(latencies, time.perf_counter() - started, queries, errors)
+
+    event.remove(engine, 'before_cursor_execute', count_statement)
+    peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {'scenarios': results, 'peak_rss_kb': peak_rss_kb}
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def smaps_rollup(pid):
+    """Return (pss_kb, private_kb) of a process, or zeros if unavailable."""
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            fields = {key: int(value.split()[0]) for key, value in
+                      (line.split(':', 1) for line in f if line.endswith('kB\n'))}
+    except (OSError, ValueError):
+        return 0, 0
+    return fields.get('Pss', 0), fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)
+
+def process_tree_memory(root_pid):
+    """Return {pid: (rss_kb, pss_kb, private_kb)} for a process and its direct children (Linux only).
+
+    RSS counts pages shared copy-on-write with the master in every worker;
+    private memory is what each additional worker really costs.
+    """
+    memory = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/status') as f:
+                status = dict(line.split(':', 1) for line in f if ':' in line)
+        except OSError:
+            continue
+        pid, ppid = int(entry), int(status.get('PPid', '0').strip())
+        if pid == root_pid or ppid == root_pid:
+            memory[pid] = (int(status.get('VmRSS', '0 kB').split()[0]),) + smaps_rollup(pid)
+    return memory
+
+def measure_dashboard_transfer(session, base_url, samples=20):
+    """Median time to first byte and bytes on the wire of a full dashboard load."""
+    first_byte, transferred = [], []
+    for _ in range(samples):
+        started = time.perf_counter()
+        with session.get(f'{base_url}/dashboard', stream=True, timeout=30) as response:
+            # Headers go out with the first body chunk
+            first_byte.append(time.perf_counter() - started)
+            transferred.append(len(response.raw.read(decode_content=False)))
+    return round(statistics.median(first_byte) * 1000, 3), int(statistics.median(transferred))
+
+def run_gunicorn_mode(app, db, shop, user_ids, args):
+    """Drive a real gunicorn (gunicorn.conf.py) over HTTP with several threads."""
+    import requests
+
+    port = free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    boot_started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+         '--workers', str(args.workers), '--bind', f'127.0.0.1:{port}', 'wsgi:app'],
+        cwd=ROOT, env=os.environ.copy(),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        deadline = time.time() + 60
+        while True:
+            if server.poll() is not None:
+                raise RuntimeError('gunicorn exited during startup')
+            try:
+                if requests.get(f'{base_url}/invite', timeout=1).status_code == 200:
+                    break
+            except requests.RequestException:
+                pass
+            if time.time() > deadline:
+                raise RuntimeError('gunicorn did not become ready within 60s')
+            time.sleep(0.05)
+        boot_seconds = time.perf_counter() - boot_started
+
+        peak = {'total_kb': 0, 'pss_kb': 0, 'worker_kb': 0, 'worker_private_kb': 0}
+        sampling = threading.Event()
+
+        def sample_rss():
+            while not sampling.is_set():
+                memory = process_tree_memory(server.pid)
+                peak['total_kb'] = max(peak['total_kb'], sum(m[0] for m in memory.values()))
+                peak['pss_kb'] = max(peak['pss_kb'], sum(m[1] for m in memory.values()))
+                workers = [m for pid, m in memory.items() if pid != server.pid]
+                if workers:
+                    peak['worker_kb'] = max(peak['worker_kb'], max(m[0] for m in workers))
+                    peak['worker_private_kb'] = max(peak['worker_private_kb'], max(m[2] for m in workers))
+                time.sleep(0.2)
+
+        sampler = threading.Thread(target=sample_rss, daemon=True)
+        sampler.start()
+
+        actors, sessions = [], []
+        for index in range(args.concurrency):
+            user_id = user_ids[index % len(user_ids)]
+            session = requests.Session()
+            anonymous_session = requests.Session()
+            sessions.append(session)
+
+            def send(method, path, data, headers, session=session):
+                response = session.request(method, base_url + path, data=data, headers=headers,
+                                           allow_redirects=False, timeout=30)
+                return response.status_code, response.headers
+
+            def send_anonymous(method, path, data, headers, session=anonymous_session):
+                return send(method, path, data, headers, session=session)
+
+            actor = Actor(send, send_anonymous, user_id, f'Benchmark User {index % len(user_ids)}',
+                          wish_ids_for(app, db, user_id), shop, args.url_length)
+            actor.login()
+            actor.run('dashboard')
+            actors.append(actor)
+
+        # Before the scenarios add wishes, so runs stay comparable
+        ttfb_ms, transfer_bytes = measure_dashboard_transfer(sessions[0], base_url)
+
+        results = {}
+        for scenario in SCENARIOS:
+            per_actor = max(1, args.requests // len(actors))
+
+            def drive(actor):
+                latencies, errors = [], 0
+                for _ in range(per_actor):
+                    request_started = time.perf_counter()
+                    status = actor.run(scenario)
+                    latencies.append(time.perf_counter() - request_started)
+                    errors += status >= 400
+                return latencies, errors
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=len(actors)) as executor:
+                outcomes = list(executor.map(drive, actors))
+            elapsed = time.perf_counter() - started
+            latencies = [latency for outcome in outcomes for latency in outcome[0]]
+            results[scenario] = summarize(latencies, elapsed, errors=sum(o[1] for o in outcomes))
+
+        sampling.set()
+        sampler.join()
+        return {
+            'scenarios': results,
+            'boot_seconds': round(boot_seconds, 3),
+            'dashboard_ttfb_ms': ttfb_ms,
+            'dashboard_transfer_bytes': transfer_bytes,
+            'peak_rss_kb': peak['total_kb'],
+            'peak_pss_kb': peak['pss_kb'],
+            'peak_worker_rss_kb': peak['worker_kb'],
+            'peak_worker_private_kb': peak['worker_private_kb']
+        }
+    finally:
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+def print_report(report, baseline=None):
+    for mode, result in report['modes'].items():
+        print(f"\n== {mode} ==")
+        extras = {key: value for key, value in result.items() if key != 'scenarios'}
+        for key, value in extras.items():
+            print(f"{key}: {value}{compare(value, baseline_value(baseline, mode, None, key))}")
+        print(f"{'scenario':<22}" + ''.join(f'{metric:>26}' for metric in METRICS))
+        for scenario, stats in result['scenarios'].items():
+            cells = []
+            for metric in METRICS:
+                value = stats[metric]
+                text = '-' if value is None else f'{value}'
+                text += compare(value, baseline_value(baseline, mode, scenario, metric))
+                cells.append(f'{text:>26}')
+            errors = f"  ({stats['errors']} errors)" if stats['errors'] else ''
+            print(f'{scenario:<22}' + ''.join(cells) + errors)
+
+def baseline_value(baseline, mode, scenario, metric):
+    if not baseline:
+        return None
+    result = baseline.get('modes', {}).get(mode, {})
+    if scenario is None:
+        return result.get(metric)
+    return result.get('scenarios', {}).get(scenario, {}).get(metric)
+
+def compare(value, old):
+    if value is None or old is None or isinstance(value, dict):
+        return ''
+    if not old:
+        return f' (was {old})'
+    return f' ({(value - old) / old * 100:+.0f}%)'
+
+def main():
+    args = parse_args()
+    workdir = tempfile.mkdtemp(prefix='wishlist-benchmark-')
+    configure_environment(workdir)
+
+    import logging
+    from app import app, db
+    # Keep the report readable
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger('wishlist.sql').setLevel(logging.ERROR)
+
+    shop = StubShop(latency=args.shop_latency, page_size=args.shop_page_size).start()
+    try:
+        user_ids = seed(app, db, shop, args)
+        report = {
+            'config': {key: value for key, value in vars(args).items()
+                       if key not in ('output', 'save_baseline', 'baseline')},
+            'modes': {}
+        }
+        if args.mode in ('client', 'both'):
+            report['modes']['client'] = run_client_mode(app, db, shop, user_ids, args)
+        if args.mode in ('gunicorn', 'both'):
+            report['modes']['gunicorn'] = run_gunicorn_mode(app, db, shop, user_ids, args)
+        report['shop_requests'] = shop.requests
+    finally:
+        shop.stop()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('config') != report['config']:
+            print('Warning: baseline was recorded with a different configuration')
+    print_report(report, baseline)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2)
+            print(f'\nReport written to {path}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Local stand-in for shop websites used by the benchmarks.
+
+Serves product pages with og: metadata padded to a configurable size and a
+product image, each after a configurable delay.
+"""
+
+import io
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from PIL import Image
+
+class StubShop:
+    """Threaded HTTP server answering /product/<n> and /image/<n>.jpg."""
+
+    def __init__(self, latency=0.1, page_size=200 * 1024, image_size=(1200, 900)):
+        self.latency = latency
+        self.page_size = page_size
+        self.requests = 0
+        self._lock = threading.Lock()
+
+        image = Image.new('RGB', image_size, (45, 134, 89))
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=90)
+        self.image = buffer.getvalue()
+
+        shop = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                with shop._lock:
+                    shop.requests += 1
+                time.sleep(shop.latency)
+                if self.path.startswith('/image/'):
+                    self._send(shop.image, 'image/jpeg')
+                elif self.path.startswith('/product/'):
+                    self._send(shop.page(self.path), 'text/html; charset=utf-8')
+                else:
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+
+            def _send(self, body, content_type):
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # The extractor stops reading once it has the head
+
+            def log_message(self, format, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            daemon_threads = True
+
+            def handle_error(self, request, client_address):
+                pass  # Clients hanging up early are expected
+
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def page(self, path):
+        product = path.split('/')[2].split('?')[0]
+        head = (f'<!DOCTYPE html><html><head><title>Produkt {product}</title>'
+                f'<meta property="og:title" content="Produkt {product}">'
+                f'<meta property="og:image" content="/image/{product}.jpg">'
+                f'</head><body><h1>Produkt {product}</h1>')
+        filler = '<p>' + 'Lorem ipsum dolor sit amet. ' * 30 + '</p>'
+        body = head
+        while len(body) < self.page_size:
+            body += filler
+        return (body + '</body></html>').encode('utf-8')
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
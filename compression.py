@@ -0,0 +1,84 @@
+"""Response compression.
+
+Text responses are compressed with brotli, if the optional brotli package
+is installed and the client accepts it, and with gzip otherwise. Bodies
+smaller than COMPRESS_MIN_SIZE are sent as they are. Streamed responses
+are compressed chunk by chunk and flushed after every chunk, so nothing
+the view has already produced is held back by the compressor.
+"""
+
+import gzip
+import os
+import zlib
+
+try:
+    import brotli
+except ImportError:  # Optional, gzip is used without it
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))  # bytes
+COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))  # gzip, 1-9
+COMPRESS_BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 4))  # 0-11, above 5 is slow per request
+# Server-sent events are not listed: proxies and browsers expect them as is
+COMPRESS_MIMETYPES = {'text/html', 'text/css', 'text/plain', 'text/csv',
+                      'application/json', 'application/javascript'}
+
+def choose_encoding(accept_encodings):
+    """Return the preferred encoding the client accepts, or None."""
+    encodings = ['br', 'gzip'] if brotli is not None else ['gzip']
+    return accept_encodings.best_match(encodings)
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=COMPRESS_BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=COMPRESS_LEVEL, mtime=0)
+
+def compress_stream(chunks, encoding):
+    """Compress an iterable of body chunks, flushing the compressor after each chunk."""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=COMPRESS_BROTLI_QUALITY)
+        process = lambda data: compressor.process(data) + compressor.flush()
+        finish = compressor.finish
+    else:
+        compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip header
+        process = lambda data: compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        finish = compressor.flush
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            if chunk:
+                yield process(chunk)
+        yield finish()
+    finally:
+        # Lets stream_with_context tear down the request context
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+def compress_response(response, accept_encodings):
+    """Compress a Flask response in place if the client accepts an encoding we offer."""
+    if response.mimetype not in COMPRESS_MIMETYPES or 'Content-Encoding' in response.headers:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(accept_encodings)
+    if encoding is None:
+        return response
+
+    # The encoded body differs byte for byte from the plain one, so its ETag
+    # can only be a weak validator. 304 answers get the same one.
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    if response.status_code != 200 or response.direct_passthrough:
+        return response
+
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return response
+        response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
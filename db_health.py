@@ -0,0 +1,139 @@
+"""Out-of-band database health monitor and circuit breaker.
+
+The breaker state lives in shared memory that is created when this module
+is first imported. gunicorn.conf.py imports it in the master process, so
+every forked worker reads and updates the same state. Request handling only
+reads the flag; the database is probed by a single background thread.
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import NullPool
+
+logger = logging.getLogger(__name__)
+
+# Health check settings
+HEALTH_CHECK_INTERVAL = int(os.environ.get('HEALTH_CHECK_INTERVAL', 10))  # seconds
+HEALTH_CHECK_TIMEOUT = 5  # seconds
+MAX_CONNECTION_ERRORS = 3
+BREAKER_COOLDOWN = int(os.environ.get('BREAKER_COOLDOWN', 15))  # seconds before probing an open breaker
+
+# Breaker states
+CLOSED = 0
+OPEN = 1
+HALF_OPEN = 2
+STATE_NAMES = {CLOSED: 'closed', OPEN: 'open', HALF_OPEN: 'half-open'}
+
+def get_database_url():
+    """Get the database URL the application uses."""
+    db_url = os.environ.get('DATABASE_URL')
+    if db_url and db_url.startswith('postgres://'):
+        db_url = db_url.replace('postgres://', 'postgresql://', 1)
+    return db_url
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker stored in process-shared memory."""
+
+    def __init__(self):
+        self._lock = multiprocessing.Lock()
+        self._state = multiprocessing.Value('i', CLOSED, lock=False)
+        self._failures = multiprocessing.Value('i', 0, lock=False)
+        self._opened_at = multiprocessing.Value('d', 0.0, lock=False)
+        self._monitor_pid = multiprocessing.Value('i', 0, lock=False)
+
+    @property
+    def state(self):
+        return self._state.value
+
+    @property
+    def state_name(self):
+        return STATE_NAMES[self._state.value]
+
+    def allow_request(self):
+        """Cheap check for the request path: False while the breaker is open."""
+        return self._state.value != OPEN
+
+    def _set_state(self, state):
+        if self._state.value != state:
+            logger.warning(f"Database circuit breaker {STATE_NAMES[self._state.value]} -> {STATE_NAMES[state]}")
+            self._state.value = state
+            if state == OPEN:
+                self._opened_at.value = time.time()
+
+    def record_success(self):
+        with self._lock:
+            self._failures.value = 0
+            self._set_state(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures.value += 1
+            # A failed probe while half-open re-opens immediately
+            if self._state.value == HALF_OPEN or self._failures.value >= MAX_CONNECTION_ERRORS:
+                self._set_state(OPEN)
+
+    def try_half_open(self):
+        """Move an open breaker to half-open once the cooldown has passed."""
+        with self._lock:
+            if self._state.value == OPEN and time.time() - self._opened_at.value >= BREAKER_COOLDOWN:
+                self._set_state(HALF_OPEN)
+
+    def claim_monitor(self):
+        """Return True if the calling process should run the health monitor."""
+        with self._lock:
+            pid = self._monitor_pid.value
+            if pid and pid != os.getpid():
+                try:
+                    os.kill(pid, 0)
+                    return False  # Another live process is monitoring
+                except OSError:
+                    pass
+            if pid == os.getpid():
+                return False  # Already running here
+            self._monitor_pid.value = os.getpid()
+            return True
+
+circuit_breaker = CircuitBreaker()
+
+class HealthMonitor(threading.Thread):
+    """Background thread that probes the database and drives the breaker."""
+
+    def __init__(self, db_url, breaker):
+        super().__init__(name='db-health-monitor', daemon=True)
+        connect_args = {}
+        if db_url.startswith('postgresql'):
+            connect_args['connect_timeout'] = HEALTH_CHECK_TIMEOUT
+        # NullPool: no connection outlives a probe, so nothing leaks into forked workers
+        self.engine = create_engine(db_url, poolclass=NullPool, connect_args=connect_args)
+        self.breaker = breaker
+
+    def check(self):
+        try:
+            with self.engine.connect() as conn:
+                conn.execute(text('SELECT 1'))
+            self.breaker.record_success()
+        except Exception as e:
+            logger.error(f"Database connection check failed: {str(e)}")
+            self.breaker.record_failure()
+
+    def run(self):
+        while True:
+            self.breaker.try_half_open()
+            if self.breaker.state != OPEN:
+                self.check()
+            # Probe more often while the database is unhealthy
+            time.sleep(HEALTH_CHECK_INTERVAL if self.breaker.state == CLOSED else 1)
+
+def start_monitor(db_url):
+    """Start the health monitor unless another process already runs it."""
+    if not circuit_breaker.claim_monitor():
+        return None
+    monitor = HealthMonitor(db_url, circuit_breaker)
+    monitor.start()
+    logger.info(f"Database health monitor started in process {os.getpid()}")
+    return monitor
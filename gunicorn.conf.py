@@ -1,16 +1,61 @@
+import os
+
+# With gevent workers, patch the standard library before anything else is
+# imported: preload_app imports the app in the master, and locks, threads
+# and sockets created there must already be gevent's
+if os.environ.get('GUNICORN_WORKER_CLASS', 'sync') == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+    if os.environ.get('DATABASE_URL', '').startswith(('postgres://', 'postgresql')):
+        # psycopg2 is a C extension; without this every query blocks the worker
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+
+import gc
 import multiprocessing
+import shutil
+import tempfile
+
+# Workers write Prometheus samples here; /metrics aggregates them. Set
+# before the app (and prometheus_client) is imported anywhere.
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR',
+                      os.path.join(tempfile.gettempdir(), 'wishlist-metrics'))
+os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+# The schema is checked once in on_starting, not by every worker
+os.environ.setdefault('SCHEMA_CHECK', 'master')
+
+# Imported in the master so the circuit breaker's shared memory is
+# created before the workers are forked
+import db_health
 
 # Server socket
 bind = "0.0.0.0:10000"
 backlog = 2048
 
-# Worker processes
+# Worker processes. GUNICORN_WORKER_CLASS selects how live dashboard
+# updates (/changes) are served:
+#   sync    (default) A worker is busy for as long as a stream is open, so
+#           each connection is answered with the changes so far and closed;
+#           browsers reconnect every CHANGES_RETRY seconds.
+#   gevent  Each connection is a greenlet, so streams stay open and idle
+#           dashboards cost almost nothing. Needs `pip install gevent`,
+#           and psycogreen with PostgreSQL.
 workers = multiprocessing.cpu_count() * 2 + 1
-worker_class = 'sync'
-worker_connections = 1000
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'sync')
+worker_connections = 1000  # Concurrent connections per gevent worker
 timeout = 30
 keepalive = 2
 
+if worker_class == 'gevent':
+    os.environ.setdefault('CHANGES_STREAM_SECONDS', '300')
+else:
+    os.environ.setdefault('CHANGES_STREAM_SECONDS', '0')
+    os.environ.setdefault('CHANGES_RETRY', '10')
+
+# Load the app once in the master; workers share its memory copy-on-write
+preload_app = True
+
 # Logging
 accesslog = '-'
 errorlog = '-'
@@ -38,7 +83,18 @@ reload_engine = 'auto'
 # Server hooks
 def on_starting(server):
     """Called just before the master process is initialized."""
-    pass
+    # Drop samples left over from a previous run
+    metrics_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+    # Already imported by preload_app; without it this loads the app here
+    from app import app, prepare_database
+    if os.environ['SCHEMA_CHECK'] == 'master':
+        prepare_database(app)
+    # Keep the garbage collector from touching (and so copying) the
+    # preloaded objects in every worker
+    gc.freeze()
 
 def on_reload(server):
     """Called before code is reloaded."""
@@ -46,7 +102,28 @@ def on_reload(server):
 
 def when_ready(server):
     """Called just after the server is started."""
-    pass
+    # One health monitor for all workers
+    db_url = db_health.get_database_url()
+    if db_url:
+        db_health.start_monitor(db_url)
+
+def worker_exit(server, worker):
+    """Called in the worker just before it exits."""
+    from querylog import query_log
+    query_log.log_summary()
+
+def post_fork(server, worker):
+    """Called in the worker just after it was forked."""
+    from app import app, db
+    # Forget connections opened by the master without closing them under it
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+def child_exit(server, worker):
+    """Called in the master after a worker exited."""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
 
 def on_exit(server):
     """Called just before the server exits."""
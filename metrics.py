@@ -0,0 +1,52 @@
+"""Prometheus metrics for the wishlist app.
+
+Under gunicorn, gunicorn.conf.py sets PROMETHEUS_MULTIPROC_DIR before any
+worker imports this module, so every worker writes its samples to files in
+that directory and /metrics aggregates them across processes.
+"""
+
+import os
+
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter,
+                               Gauge, Histogram, generate_latest, multiprocess)
+
+# Request metrics
+REQUEST_LATENCY = Histogram(
+    'wishlist_request_duration_seconds', 'Request latency',
+    ['endpoint', 'method', 'status']
+)
+REQUEST_SQL_QUERIES = Histogram(
+    'wishlist_request_sql_queries', 'SQL statements executed per request',
+    ['endpoint'], buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+)
+REQUEST_SQL_SECONDS = Histogram(
+    'wishlist_request_sql_seconds', 'Time spent executing SQL per request',
+    ['endpoint'], buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+
+# Database metrics
+DB_POOL_WAIT = Histogram(
+    'wishlist_db_pool_checkout_seconds', 'Time spent waiting for a pooled database connection',
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30)
+)
+DB_RETRIES = Counter('wishlist_db_retries_total', 'Database operations retried by retry_db_operation')
+DB_BREAKER_STATE = Gauge(
+    'wishlist_db_breaker_state', 'Database circuit breaker state (0 closed, 1 open, 2 half-open)',
+    multiprocess_mode='max'
+)
+
+# Metadata and cache metrics
+METADATA_FETCH = Histogram(
+    'wishlist_metadata_fetch_seconds', 'Shop page metadata fetch latency',
+    ['domain', 'outcome'], buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+CACHE_LOOKUPS = Counter('wishlist_cache_lookups_total', 'Cache lookups', ['cache', 'result'])
+
+def render_latest():
+    """Return (body, content type) for all metrics of all worker processes."""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
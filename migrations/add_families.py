@@ -0,0 +1,104 @@
+"""Partition users and wishes by family
+
+This migration adds the family table and a family_id column to users and
+wishes. Existing rows are assigned to one default family whose invite token
+is INVITE_TOKEN (or a generated one, which is printed). User names become
+unique per family instead of globally, and wishes get an index on
+(family_id, updated_at) for the dashboard ETag.
+"""
+
+from sqlalchemy import inspect, text
+from datetime import datetime
+import os
+import secrets
+
+from migrations.runner import get_engine
+from migrations.rebuild import rebuild_table
+
+def column_exists(table_name, column_name):
+    """Check if a column exists in a table."""
+    engine = get_engine()
+    inspector = inspect(engine)
+    columns = [c['name'] for c in inspector.get_columns(table_name)]
+    return column_name in columns
+
+def create_default_family(conn):
+    """Return the id of the first family, creating it if there is none."""
+    family_id = conn.execute(text('SELECT MIN(id) FROM family')).scalar()
+    if family_id is not None:
+        return family_id
+    token = os.environ.get('INVITE_TOKEN')
+    if not token:
+        token = secrets.token_urlsafe(16)
+        print(f"Created a new invite token for existing users: {token}")
+    conn.execute(text('INSERT INTO family (name, invite_token, created_at) VALUES (:name, :token, :now)'),
+                 {'name': 'Familie', 'token': token, 'now': datetime.utcnow()})
+    return conn.execute(text('SELECT MIN(id) FROM family')).scalar()
+
+def upgrade():
+    """Add families and assign existing users and wishes to a default family."""
+    engine = get_engine()
+    postgres = engine.dialect.name == 'postgresql'
+    with engine.begin() as conn:
+        conn.execute(text(f'''
+            CREATE TABLE IF NOT EXISTS family (
+                id {'SERIAL' if postgres else 'INTEGER'} PRIMARY KEY,
+                name VARCHAR(100) NOT NULL,
+                invite_token VARCHAR(64) NOT NULL UNIQUE,
+                created_at TIMESTAMP
+            )
+        '''))
+        family_id = create_default_family(conn)
+
+    for table_name in ('user', 'wish'):
+        if not column_exists(table_name, 'family_id'):
+            with engine.begin() as conn:
+                conn.execute(text(f'ALTER TABLE "{table_name}" ADD COLUMN family_id INTEGER REFERENCES family(id)'))
+        with engine.begin() as conn:
+            conn.execute(text(f'UPDATE "{table_name}" SET family_id = :family_id WHERE family_id IS NULL'),
+                         {'family_id': family_id})
+            if postgres:
+                conn.execute(text(f'ALTER TABLE "{table_name}" ALTER COLUMN family_id SET NOT NULL'))
+
+    # Names only need to be unique within a family
+    unique = inspect(engine).get_unique_constraints('user')
+    if not any(c['column_names'] == ['family_id', 'name'] for c in unique):
+        if postgres:
+            with engine.begin() as conn:
+                for constraint in unique:
+                    if constraint['column_names'] == ['name']:
+                        conn.execute(text(f'ALTER TABLE "user" DROP CONSTRAINT "{constraint["name"]}"'))
+                conn.execute(text('ALTER TABLE "user" ADD CONSTRAINT uq_user_family_name UNIQUE (family_id, name)'))
+        else:
+            rebuild_table(engine, 'user', {}, unique_constraints={'uq_user_family_name': ('family_id', 'name')})
+
+    if postgres:
+        # CONCURRENTLY does not block writes but cannot run inside a transaction
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.execute(text('CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_wish_family_updated '
+                              'ON wish (family_id, updated_at)'))
+    else:
+        with engine.begin() as conn:
+            conn.execute(text('CREATE INDEX IF NOT EXISTS ix_wish_family_updated ON wish (family_id, updated_at)'))
+
+def downgrade():
+    """Remove families; all users share one global name space again."""
+    engine = get_engine()
+    postgres = engine.dialect.name == 'postgresql'
+    with engine.begin() as conn:
+        conn.execute(text('DROP INDEX IF EXISTS ix_wish_family_updated'))
+    if postgres:
+        with engine.begin() as conn:
+            conn.execute(text('ALTER TABLE "user" DROP CONSTRAINT IF EXISTS uq_user_family_name'))
+            conn.execute(text('ALTER TABLE "user" ADD CONSTRAINT user_name_key UNIQUE (name)'))
+    else:
+        rebuild_table(engine, 'user', {}, unique_constraints={'uq_user_name': ('name',)})
+    for table_name in ('wish', 'user'):
+        if column_exists(table_name, 'family_id'):
+            with engine.begin() as conn:
+                conn.execute(text(f'ALTER TABLE "{table_name}" DROP COLUMN family_id'))
+    with engine.begin() as conn:
+        conn.execute(text('DROP TABLE IF EXISTS family'))
+
+if __name__ == '__main__':
+    upgrade()
@@ -0,0 +1,36 @@
+"""Add metadata_status column to wishes
+
+This migration adds the metadata_status column used to track background
+metadata enrichment. Existing wishes are marked as done.
+"""
+
+from sqlalchemy import inspect, text
+
+from migrations.runner import get_engine
+
+def column_exists(table_name, column_name):
+    """Check if a column exists in a table."""
+    engine = get_engine()
+    inspector = inspect(engine)
+    columns = [c['name'] for c in inspector.get_columns(table_name)]
+    return column_name in columns
+
+def upgrade():
+    """Add metadata_status column to wishes table."""
+    engine = get_engine()
+    if not column_exists('wish', 'metadata_status'):
+        with engine.begin() as conn:
+            conn.execute(text("""
+                ALTER TABLE wish 
+                ADD COLUMN metadata_status VARCHAR(20) DEFAULT 'done'
+            """))
+
+def downgrade():
+    """Remove metadata_status column from wishes table."""
+    engine = get_engine()
+    if column_exists('wish', 'metadata_status'):
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE wish DROP COLUMN metadata_status"))
+
+if __name__ == '__main__':
+    upgrade()
@@ -3,15 +3,9 @@
 This migration adds a priority column to the wishes table.
 """
 
-from sqlalchemy import create_engine, inspect, text
-import os
+from sqlalchemy import inspect, text
 
-def get_engine():
-    """Get SQLAlchemy engine."""
-    db_url = os.environ.get('DATABASE_URL')
-    if db_url and db_url.startswith('postgres://'):
-        db_url = db_url.replace('postgres://', 'postgresql://', 1)
-    return create_engine(db_url or 'sqlite:///wishlist.db')
+from migrations.runner import get_engine
 
 def column_exists(table_name, column_name):
     """Check if a column exists in a table."""
@@ -0,0 +1,33 @@
+"""Add thumbnail_hash column to wishes
+
+This migration adds the thumbnail_hash column that points to the locally
+cached, resized copy of a wish's thumbnail.
+"""
+
+from sqlalchemy import inspect, text
+
+from migrations.runner import get_engine
+
+def column_exists(table_name, column_name):
+    """Check if a column exists in a table."""
+    engine = get_engine()
+    inspector = inspect(engine)
+    columns = [c['name'] for c in inspector.get_columns(table_name)]
+    return column_name in columns
+
+def upgrade():
+    """Add thumbnail_hash column to wishes table."""
+    engine = get_engine()
+    if not column_exists('wish', 'thumbnail_hash'):
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE wish ADD COLUMN thumbnail_hash VARCHAR(64)"))
+
+def downgrade():
+    """Remove thumbnail_hash column from wishes table."""
+    engine = get_engine()
+    if column_exists('wish', 'thumbnail_hash'):
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE wish DROP COLUMN thumbnail_hash"))
+
+if __name__ == '__main__':
+    upgrade()
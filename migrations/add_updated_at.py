@@ -0,0 +1,35 @@
+"""Add updated_at column to wishes
+
+This migration adds the updated_at column used to build the dashboard
+ETag. Existing wishes get their creation time as modification time.
+"""
+
+from sqlalchemy import inspect, text
+
+from migrations.runner import get_engine
+
+def column_exists(table_name, column_name):
+    """Check if a column exists in a table."""
+    engine = get_engine()
+    inspector = inspect(engine)
+    columns = [c['name'] for c in inspector.get_columns(table_name)]
+    return column_name in columns
+
+def upgrade():
+    """Add updated_at column to wishes table."""
+    engine = get_engine()
+    if not column_exists('wish', 'updated_at'):
+        column_type = 'DATETIME' if engine.dialect.name == 'sqlite' else 'TIMESTAMP'
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE wish ADD COLUMN updated_at {column_type}"))
+            conn.execute(text("UPDATE wish SET updated_at = created_at"))
+
+def downgrade():
+    """Remove updated_at column from wishes table."""
+    engine = get_engine()
+    if column_exists('wish', 'updated_at'):
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE wish DROP COLUMN updated_at"))
+
+if __name__ == '__main__':
+    upgrade()
@@ -0,0 +1,90 @@
+"""Add url_hash column to wishes
+
+This migration adds the url_hash column, the SHA-256 of a wish's canonical
+URL (see urls.py), fills it in for existing wishes and adds an index on
+(family_id, url_hash) for duplicate detection. Wishes are hashed in batches
+in short transactions, so the app can keep writing meanwhile, and an
+interrupted backfill continues where it stopped. Existing short links are
+hashed as they are; they are resolved the next time their metadata is
+fetched.
+"""
+
+from sqlalchemy import inspect, text
+import logging
+
+from migrations.runner import get_engine
+from urls import url_hash
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = 'ix_wish_family_url_hash'
+BATCH_SIZE = 1000
+
+def column_exists(table_name, column_name):
+    """Check if a column exists in a table."""
+    engine = get_engine()
+    inspector = inspect(engine)
+    columns = [c['name'] for c in inspector.get_columns(table_name)]
+    return column_name in columns
+
+def backfill(engine, batch_size=BATCH_SIZE):
+    """Hash the URLs of all wishes that have none yet, in primary-key order."""
+    last_id = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(text('''
+                SELECT id, url FROM wish
+                WHERE url_hash IS NULL AND url != '' AND id > :last_id
+                ORDER BY id
+                LIMIT :batch_size
+            '''), {'last_id': last_id, 'batch_size': batch_size}).all()
+            if rows:
+                conn.execute(text('UPDATE wish SET url_hash = :url_hash WHERE id = :id'),
+                             [{'id': row.id, 'url_hash': url_hash(row.url)} for row in rows])
+        if rows:
+            last_id = rows[-1].id
+            logger.info(f"Hashed {len(rows)} wish URLs up to id {last_id}")
+        if len(rows) < batch_size:
+            break
+
+def upgrade():
+    """Add, fill and index the url_hash column."""
+    engine = get_engine()
+    if not column_exists('wish', 'url_hash'):
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE wish ADD COLUMN url_hash VARCHAR(64)"))
+    # Before the index exists, so the updates do not maintain it
+    backfill(engine)
+    if engine.dialect.name == 'postgresql':
+        # CONCURRENTLY does not block writes but cannot run inside a transaction
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            # An interrupted concurrent build leaves an invalid index behind
+            valid = conn.execute(text("""
+                SELECT i.indisvalid FROM pg_index i
+                JOIN pg_class c ON c.oid = i.indexrelid
+                WHERE c.relname = :name
+            """), {'name': INDEX_NAME}).scalar()
+            if valid is False:
+                conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {INDEX_NAME}'))
+            conn.execute(text(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {INDEX_NAME} '
+                              f'ON wish (family_id, url_hash)'))
+    else:
+        with engine.begin() as conn:
+            conn.execute(text(f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} '
+                              f'ON wish (family_id, url_hash)'))
+
+def downgrade():
+    """Drop the url_hash index and column."""
+    engine = get_engine()
+    if engine.dialect.name == 'postgresql':
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {INDEX_NAME}'))
+    else:
+        with engine.begin() as conn:
+            conn.execute(text(f'DROP INDEX IF EXISTS {INDEX_NAME}'))
+    if column_exists('wish', 'url_hash'):
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE wish DROP COLUMN url_hash"))
+
+if __name__ == '__main__':
+    upgrade()
@@ -0,0 +1,39 @@
+"""Add the dashboard change feed
+
+This migration adds the wish_change table that the write paths append to
+and /changes streams to open dashboards, with an index on (family_id, id)
+for reading one family's changes in order.
+"""
+
+from sqlalchemy import text
+
+from migrations.runner import get_engine
+
+def upgrade():
+    """Create the change feed table and its index."""
+    engine = get_engine()
+    postgres = engine.dialect.name == 'postgresql'
+    # AUTOINCREMENT keeps SQLite from reusing ids once old changes are pruned
+    primary_key = 'SERIAL PRIMARY KEY' if postgres else 'INTEGER PRIMARY KEY AUTOINCREMENT'
+    with engine.begin() as conn:
+        conn.execute(text(f'''
+            CREATE TABLE IF NOT EXISTS wish_change (
+                id {primary_key},
+                family_id INTEGER NOT NULL REFERENCES family(id),
+                user_id INTEGER NOT NULL,
+                wish_id INTEGER,
+                kind VARCHAR(20) NOT NULL,
+                created_at TIMESTAMP NOT NULL
+            )
+        '''))
+        # The table is new, so a plain index does not block anyone
+        conn.execute(text('CREATE INDEX IF NOT EXISTS ix_wish_change_family ON wish_change (family_id, id)'))
+
+def downgrade():
+    """Drop the change feed."""
+    engine = get_engine()
+    with engine.begin() as conn:
+        conn.execute(text('DROP TABLE IF EXISTS wish_change'))
+
+if __name__ == '__main__':
+    upgrade()
@@ -0,0 +1,46 @@
+"""Add indexes for reading a user's wishes
+
+This migration adds an index on (user_id, priority, id DESC), the order in
+which the dashboard and the API list a user's wishes. Its user_id prefix
+also serves plain lookups by user_id, e.g. when an account is deleted.
+"""
+
+from sqlalchemy import text
+
+from migrations.runner import get_engine
+
+INDEX_NAME = 'ix_wish_user_priority'
+
+def upgrade():
+    """Create the wish index."""
+    engine = get_engine()
+    if engine.dialect.name == 'postgresql':
+        # CONCURRENTLY does not block writes but cannot run inside a transaction
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            # An interrupted concurrent build leaves an invalid index behind
+            valid = conn.execute(text("""
+                SELECT i.indisvalid FROM pg_index i
+                JOIN pg_class c ON c.oid = i.indexrelid
+                WHERE c.relname = :name
+            """), {'name': INDEX_NAME}).scalar()
+            if valid is False:
+                conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {INDEX_NAME}'))
+            conn.execute(text(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {INDEX_NAME} '
+                              f'ON wish (user_id, priority, id DESC)'))
+    else:
+        with engine.begin() as conn:
+            conn.execute(text(f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} '
+                              f'ON wish (user_id, priority, id DESC)'))
+
+def downgrade():
+    """Drop the wish index."""
+    engine = get_engine()
+    if engine.dialect.name == 'postgresql':
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {INDEX_NAME}'))
+    else:
+        with engine.begin() as conn:
+            conn.execute(text(f'DROP INDEX IF EXISTS {INDEX_NAME}'))
+
+if __name__ == '__main__':
+    upgrade()
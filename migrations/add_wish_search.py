@@ -0,0 +1,68 @@
+"""Add full-text search over wishes
+
+This migration adds a description column to wishes and to the URL metadata
+cache, and the full-text index described in search.py: an FTS5 table kept
+in sync by triggers on SQLite, a generated tsvector column with a GIN index
+on Postgres. Existing wishes are indexed right away; their descriptions are
+filled in as their metadata is fetched again.
+"""
+
+from sqlalchemy import inspect, text
+
+from migrations.runner import get_engine
+from search import POSTGRES_COLUMN_DDL, POSTGRES_INDEX_NAME, POSTGRES_INDEX_COLUMNS, create_search_index
+
+def column_exists(table_name, column_name):
+    """Check if a column exists in a table."""
+    engine = get_engine()
+    inspector = inspect(engine)
+    columns = [c['name'] for c in inspector.get_columns(table_name)]
+    return column_name in columns
+
+def upgrade():
+    """Add description columns and the full-text index."""
+    engine = get_engine()
+    for table_name in ('wish', 'url_metadata'):
+        if inspect(engine).has_table(table_name) and not column_exists(table_name, 'description'):
+            with engine.begin() as conn:
+                conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN description VARCHAR(500)"))
+
+    if engine.dialect.name == 'postgresql':
+        # Adding the generated column rewrites the table once
+        with engine.begin() as conn:
+            conn.execute(text(POSTGRES_COLUMN_DDL))
+        # CONCURRENTLY does not block writes but cannot run inside a transaction
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            # An interrupted concurrent build leaves an invalid index behind
+            valid = conn.execute(text("""
+                SELECT i.indisvalid FROM pg_index i
+                JOIN pg_class c ON c.oid = i.indexrelid
+                WHERE c.relname = :name
+            """), {'name': POSTGRES_INDEX_NAME}).scalar()
+            if valid is False:
+                conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {POSTGRES_INDEX_NAME}'))
+            conn.execute(text(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {POSTGRES_INDEX_NAME} '
+                              f'ON wish {POSTGRES_INDEX_COLUMNS}'))
+    else:
+        with engine.begin() as conn:
+            create_search_index(conn)
+
+def downgrade():
+    """Drop the full-text index and the description columns."""
+    engine = get_engine()
+    if engine.dialect.name == 'postgresql':
+        with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {POSTGRES_INDEX_NAME}'))
+            conn.execute(text('ALTER TABLE wish DROP COLUMN IF EXISTS search_vector'))
+    else:
+        with engine.begin() as conn:
+            for trigger in ('wish_fts_insert', 'wish_fts_delete', 'wish_fts_update'):
+                conn.execute(text(f'DROP TRIGGER IF EXISTS {trigger}'))
+            conn.execute(text('DROP TABLE IF EXISTS wish_fts'))
+    for table_name in ('wish', 'url_metadata'):
+        if inspect(engine).has_table(table_name) and column_exists(table_name, 'description'):
+            with engine.begin() as conn:
+                conn.execute(text(f"ALTER TABLE {table_name} DROP COLUMN description"))
+
+if __name__ == '__main__':
+    upgrade()
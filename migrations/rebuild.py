@@ -0,0 +1,91 @@
+"""Batched table rebuilds for SQLite
+
+SQLite cannot change a column type in place, so the table is copied into a
+new one. Rows are copied in primary-key order in short transactions, so
+other connections can keep writing between batches, and an interrupted
+rebuild continues where it stopped when it is run again.
+"""
+
+from sqlalchemy import MetaData, Table, UniqueConstraint, inspect, select, func, text
+import logging
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+def rebuild_table(engine, table_name, column_types, unique_constraints=None, batch_size=BATCH_SIZE):
+    """Rebuild table_name with the columns in column_types changed to the given types.
+
+    The new table is created from the reflected schema, so columns added by
+    later migrations are carried over. unique_constraints, if given, maps
+    constraint names to column tuples and replaces the table's unique
+    constraints. The table needs an integer primary key.
+    """
+    new_name = f'{table_name}_new'
+    inspector = inspect(engine)
+    with engine.connect() as conn:
+        # Automatic indexes of constraints have no SQL and come back with the
+        # table. Triggers are dropped with the old table, e.g. the search index's.
+        index_sql = conn.execute(text(
+            "SELECT sql FROM sqlite_master WHERE type IN ('index', 'trigger') "
+            "AND tbl_name = :name AND sql IS NOT NULL"
+        ), {'name': table_name}).scalars().all()
+
+    metadata = MetaData()
+    table = Table(table_name, metadata, autoload_with=engine)
+    new_table = table.to_metadata(metadata, name=new_name)
+    new_table.indexes.clear()  # Index names are global in SQLite; recreated after the swap
+    for name, type_ in column_types.items():
+        new_table.c[name].type = type_
+    if unique_constraints is not None:
+        for constraint in [c for c in new_table.constraints if isinstance(c, UniqueConstraint)]:
+            new_table.constraints.remove(constraint)
+        for column in new_table.columns:
+            column.unique = None
+        for name, columns in unique_constraints.items():
+            new_table.append_constraint(UniqueConstraint(*columns, name=name))
+    if inspector.has_table(new_name) and not _matches(engine, new_table):
+        # Left over from something else than an interrupted run of this rebuild
+        with engine.begin() as conn:
+            conn.execute(text(f'DROP TABLE "{new_name}"'))
+    new_table.create(engine, checkfirst=True)  # An existing copy means we are resuming
+
+    pk = table.primary_key.columns.values()[0].name
+    columns = ', '.join(f'"{column.name}"' for column in table.columns)
+
+    # Copy in batches; each batch commits on its own
+    while True:
+        with engine.begin() as conn:
+            last_id = conn.execute(select(func.max(new_table.c[pk]))).scalar() or 0
+            copied = conn.execute(text(f'''
+                INSERT INTO "{new_name}" ({columns})
+                SELECT {columns} FROM "{table_name}"
+                WHERE "{pk}" > :last_id
+                ORDER BY "{pk}"
+                LIMIT :batch_size
+            '''), {'last_id': last_id, 'batch_size': batch_size}).rowcount
+        logger.info(f"Copied {copied} rows of {table_name} after id {last_id}")
+        if copied < batch_size:
+            break
+
+    # Swap in one short transaction, catching up on writes made during the copy
+    with engine.begin() as conn:
+        conn.execute(text(f'''
+            DELETE FROM "{new_name}" WHERE "{pk}" NOT IN (SELECT "{pk}" FROM "{table_name}")
+        '''))
+        conn.execute(text(f'''
+            INSERT OR REPLACE INTO "{new_name}" ({columns})
+            SELECT {columns} FROM "{table_name}"
+            EXCEPT SELECT {columns} FROM "{new_name}"
+        '''))
+        conn.execute(text(f'DROP TABLE "{table_name}"'))
+        conn.execute(text(f'ALTER TABLE "{new_name}" RENAME TO "{table_name}"'))
+        for sql in index_sql:
+            conn.execute(text(sql))
+
+def _matches(engine, expected):
+    """Check that an existing table has the columns and types of expected."""
+    existing = Table(expected.name, MetaData(), autoload_with=engine)
+    if [c.name for c in existing.columns] != [c.name for c in expected.columns]:
+        return False
+    return all(str(existing.c[c.name].type) == str(c.type) for c in expected.columns)
@@ -0,0 +1,109 @@
+"""Apply pending migrations in order
+
+Applied migrations are recorded in the schema_version table. A database
+created from the models by create_app is stamped with every migration, so
+only databases created by an older version have anything to apply.
+
+    python -m migrations.runner            # apply pending migrations
+    python -m migrations.runner status     # list applied and pending
+    python -m migrations.runner stamp      # mark all as applied without running
+"""
+
+from sqlalchemy import create_engine, inspect, MetaData, Table, Column, String, DateTime, select
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime
+import importlib
+import logging
+import os
+import sys
+
+logger = logging.getLogger(__name__)
+
+# Module names in migrations/, oldest first. Append new migrations at the end.
+MIGRATIONS = [
+    'add_priority',
+    'increase_url_length',
+    'add_metadata_status',
+    'add_updated_at',
+    'add_thumbnail_hash',
+    'add_wish_indexes',
+    'add_families',
+    'add_wish_changes',
+    'add_wish_search',
+    'add_url_hash',
+]
+
+metadata = MetaData()
+schema_version = Table(
+    'schema_version', metadata,
+    Column('version', String(100), primary_key=True),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+# Without DATABASE_URL the app keeps its SQLite database in Flask's instance
+# folder, next to app.py, whatever the working directory
+DEFAULT_DATABASE_URL = 'sqlite:///' + os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'instance', 'wishlist.db')
+
+def get_engine():
+    """Get SQLAlchemy engine for the app's database; every migration uses it."""
+    db_url = os.environ.get('DATABASE_URL')
+    if db_url and db_url.startswith('postgres://'):
+        db_url = db_url.replace('postgres://', 'postgresql://', 1)
+    return create_engine(db_url or DEFAULT_DATABASE_URL)
+
+def applied_versions(engine):
+    """Return the names of all applied migrations."""
+    if not inspect(engine).has_table('schema_version'):
+        return set()
+    with engine.connect() as conn:
+        return set(conn.execute(select(schema_version.c.version)).scalars())
+
+def pending_migrations(engine):
+    """Return the migrations not yet applied, in order."""
+    applied = applied_versions(engine)
+    return [name for name in MIGRATIONS if name not in applied]
+
+def record(engine, name):
+    schema_version.create(engine, checkfirst=True)
+    try:
+        with engine.begin() as conn:
+            conn.execute(schema_version.insert().values(version=name, applied_at=datetime.utcnow()))
+    except IntegrityError:
+        pass  # Recorded concurrently by another process
+
+def stamp(engine):
+    """Mark every migration as applied, e.g. after create_all on a fresh database."""
+    for name in pending_migrations(engine):
+        record(engine, name)
+
+def upgrade():
+    """Apply all pending migrations in order."""
+    engine = get_engine()
+    for name in pending_migrations(engine):
+        logger.info(f"Applying migration {name}")
+        # Each migration is idempotent, so one interrupted before being
+        # recorded is simply run again
+        importlib.import_module(f'migrations.{name}').upgrade()
+        record(engine, name)
+        logger.info(f"Applied migration {name}")
+
+def main(argv):
+    logging.basicConfig(level=logging.INFO)
+    command = argv[1] if len(argv) > 1 else 'upgrade'
+    engine = get_engine()
+    if command == 'upgrade':
+        upgrade()
+    elif command == 'stamp':
+        stamp(engine)
+    elif command == 'status':
+        applied = applied_versions(engine)
+        for name in MIGRATIONS:
+            print(f"{'applied' if name in applied else 'pending'}  {name}")
+    else:
+        print(f"Unknown command: {command}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
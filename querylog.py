@@ -0,0 +1,153 @@
+"""Sampled slow-query log.
+
+Replaces SQLAlchemy's echo output. Every statement is normalized into a
+fingerprint (literals and placeholders replaced by ``?``) and counted in
+per-fingerprint aggregates. Only statements slower than SQL_SLOW_QUERY_MS,
+plus a random SQL_LOG_SAMPLE_RATE share of the rest, are written to the log,
+one JSON object per line.
+"""
+
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+
+from sqlalchemy import event
+
+logger = logging.getLogger('wishlist.sql')
+
+SQL_SLOW_QUERY_MS = float(os.environ.get('SQL_SLOW_QUERY_MS', 200))  # milliseconds
+SQL_LOG_SAMPLE_RATE = float(os.environ.get('SQL_LOG_SAMPLE_RATE', 0.0))  # share of fast queries logged
+SQL_EXPLAIN = os.environ.get('SQL_EXPLAIN', '').lower() in ('1', 'true', 'yes')
+SQL_SUMMARY_INTERVAL = int(os.environ.get('SQL_SUMMARY_INTERVAL', 300))  # seconds, 0 disables
+SQL_MAX_FINGERPRINTS = 500
+SQL_MAX_STATEMENT_LENGTH = 2000
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%\(\w+\)s|%s|(?<!:):\w+|\$\d+')
+_VALUE_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+def fingerprint(statement):
+    """Normalize a statement so queries differing only in values group together."""
+    normalized = _STRING.sub('?', statement)
+    normalized = _PLACEHOLDER.sub('?', normalized)
+    normalized = _NUMBER.sub('?', normalized)
+    # IN lists and multi-row VALUES of any length share one fingerprint
+    normalized = _VALUE_LIST.sub('(?+)', normalized)
+    return _WHITESPACE.sub(' ', normalized).strip()
+
+class QueryLog:
+    """Per-process statement aggregates plus the slow/sampled log."""
+
+    def __init__(self, slow_ms=SQL_SLOW_QUERY_MS, sample_rate=SQL_LOG_SAMPLE_RATE,
+                 explain=SQL_EXPLAIN, summary_interval=SQL_SUMMARY_INTERVAL):
+        self.slow_ms = slow_ms
+        self.sample_rate = sample_rate
+        self.explain = explain
+        self.summary_interval = summary_interval
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._last_summary = time.monotonic()
+
+    def attach(self, engine):
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._querylog_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is None or not hasattr(context, '_querylog_started'):
+            return
+        elapsed_ms = (time.perf_counter() - context._querylog_started) * 1000
+        key = fingerprint(statement)
+        slow = elapsed_ms >= self.slow_ms
+        self._record(key, elapsed_ms, slow)
+
+        if slow or (self.sample_rate and random.random() < self.sample_rate):
+            entry = {
+                'event': 'slow_query' if slow else 'sampled_query',
+                'fingerprint': key,
+                'duration_ms': round(elapsed_ms, 3),
+                'rows': cursor.rowcount,
+                'executemany': executemany,
+                'statement': statement[:SQL_MAX_STATEMENT_LENGTH],
+            }
+            if slow and self.explain and not executemany:
+                entry['plan'] = self._explain(conn, statement, parameters)
+            logger.log(logging.WARNING if slow else logging.INFO, json.dumps(entry, default=str))
+
+        if self.summary_interval and time.monotonic() - self._last_summary >= self.summary_interval:
+            self.log_summary()
+
+    def _record(self, key, elapsed_ms, slow):
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                if len(self._stats) >= SQL_MAX_FINGERPRINTS:
+                    key = '<other>'
+                stats = self._stats.setdefault(key, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'slow': 0})
+            stats['count'] += 1
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+            if slow:
+                stats['slow'] += 1
+
+    def _explain(self, conn, statement, parameters):
+        """Return the query plan of a read statement, or None."""
+        if not statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            return None  # EXPLAIN of writes is not worth the risk inside a transaction
+        prefix = 'EXPLAIN QUERY PLAN ' if conn.dialect.name == 'sqlite' else 'EXPLAIN '
+        # On Postgres a failed statement aborts the whole request transaction;
+        # a savepoint confines a failing EXPLAIN to itself
+        savepoint = conn.dialect.name != 'sqlite'
+        try:
+            # A separate cursor on the same DBAPI connection leaves the
+            # original cursor's result set untouched
+            cursor = conn.connection.dbapi_connection.cursor()
+            try:
+                if savepoint:
+                    cursor.execute('SAVEPOINT querylog_explain')
+                try:
+                    cursor.execute(prefix + statement, parameters)
+                    return [' '.join(str(column) for column in row) for row in cursor.fetchall()]
+                except Exception:
+                    if savepoint:
+                        cursor.execute('ROLLBACK TO SAVEPOINT querylog_explain')
+                    raise
+                finally:
+                    if savepoint:
+                        cursor.execute('RELEASE SAVEPOINT querylog_explain')
+            finally:
+                cursor.close()
+        except Exception as e:
+            logger.debug(f"EXPLAIN failed: {str(e)}")
+            return None
+
+    def snapshot(self):
+        """Return the aggregates sorted by total time, most expensive first."""
+        with self._lock:
+            items = [(key, dict(stats)) for key, stats in self._stats.items()]
+        return sorted(items, key=lambda item: item[1]['total_ms'], reverse=True)
+
+    def log_summary(self, limit=10):
+        self._last_summary = time.monotonic()
+        for key, stats in self.snapshot()[:limit]:
+            logger.info(json.dumps({
+                'event': 'query_summary',
+                'pid': os.getpid(),
+                'fingerprint': key,
+                'count': stats['count'],
+                'total_ms': round(stats['total_ms'], 3),
+                'mean_ms': round(stats['total_ms'] / stats['count'], 3),
+                'max_ms': round(stats['max_ms'], 3),
+                'slow': stats['slow'],
+            }))
+
+query_log = QueryLog()
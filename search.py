@@ -0,0 +1,97 @@
+"""Full-text search over wishes.
+
+SQLite keeps an FTS5 index (wish_fts) over the name, URL and description
+of each wish, as an external-content table that triggers on the wish table
+keep in sync. Postgres keeps a generated tsvector column (search_vector)
+with a GIN index. Both are created when the wish table is created and by
+migrations/add_wish_search.py on existing databases.
+
+Every word of a query must match, as a prefix, so results narrow while
+typing. Matches in the name rank above the description, and those rank
+above the URL.
+"""
+
+import re
+
+from sqlalchemy import Float, Integer, text
+
+SEARCH_MAX_TERMS = 8
+
+SQLITE_DDL = [
+    # Indexes the wish table's columns without storing a second copy
+    """CREATE VIRTUAL TABLE IF NOT EXISTS wish_fts USING fts5(
+        name, url, description,
+        content='wish', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS wish_fts_insert AFTER INSERT ON wish BEGIN
+        INSERT INTO wish_fts (rowid, name, url, description)
+        VALUES (new.id, new.name, new.url, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS wish_fts_delete AFTER DELETE ON wish BEGIN
+        INSERT INTO wish_fts (wish_fts, rowid, name, url, description)
+        VALUES ('delete', old.id, old.name, old.url, old.description);
+    END""",
+    # Priority changes and the like do not touch the index
+    """CREATE TRIGGER IF NOT EXISTS wish_fts_update AFTER UPDATE OF name, url, description ON wish BEGIN
+        INSERT INTO wish_fts (wish_fts, rowid, name, url, description)
+        VALUES ('delete', old.id, old.name, old.url, old.description);
+        INSERT INTO wish_fts (rowid, name, url, description)
+        VALUES (new.id, new.name, new.url, new.description);
+    END""",
+]
+
+# URLs are split into words first; the default parser would keep a whole
+# host or path as one token
+POSTGRES_COLUMN_DDL = """
+    ALTER TABLE wish ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(description, '')), 'B') ||
+        setweight(to_tsvector('simple', regexp_replace(coalesce(url, ''), '[^[:alnum:]]+', ' ', 'g')), 'C')
+    ) STORED
+"""
+POSTGRES_INDEX_NAME = 'ix_wish_search'
+POSTGRES_INDEX_COLUMNS = 'USING GIN (search_vector)'
+
+def create_search_index(connection):
+    """Create the full-text index for the connection's dialect and fill it."""
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text(POSTGRES_COLUMN_DDL))
+        connection.execute(text(f'CREATE INDEX IF NOT EXISTS {POSTGRES_INDEX_NAME} '
+                                f'ON wish {POSTGRES_INDEX_COLUMNS}'))
+    else:
+        for statement in SQLITE_DDL:
+            connection.execute(text(statement))
+        connection.execute(text("INSERT INTO wish_fts (wish_fts) VALUES ('rebuild')"))
+
+def search_terms(query):
+    """Split a search query into at most SEARCH_MAX_TERMS lowercased words."""
+    return [term.lower() for term in re.findall(r'\w+', query or '')][:SEARCH_MAX_TERMS]
+
+def search_statement(dialect_name, family_id, query, limit, offset=0):
+    """Return a statement selecting (id, rank) of a family's wishes matching
+    every word of query, best match first, or None if query has no words."""
+    terms = search_terms(query)
+    if not terms:
+        return None
+    params = {'family_id': family_id, 'limit': limit, 'offset': offset}
+    if dialect_name == 'postgresql':
+        params['query'] = ' & '.join(f'{term}:*' for term in terms)
+        statement = text("""
+            SELECT id, ts_rank(search_vector, to_tsquery('simple', :query)) AS rank
+            FROM wish
+            WHERE family_id = :family_id AND search_vector @@ to_tsquery('simple', :query)
+            ORDER BY rank DESC, id DESC
+            LIMIT :limit OFFSET :offset
+        """)
+    else:
+        # Quoted, so words like AND or NEAR are not read as FTS5 syntax
+        params['query'] = ' '.join(f'"{term}"*' for term in terms)
+        statement = text("""
+            SELECT wish.id, bm25(wish_fts, 10.0, 1.0, 4.0) AS rank
+            FROM wish_fts JOIN wish ON wish.id = wish_fts.rowid
+            WHERE wish_fts MATCH :query AND wish.family_id = :family_id
+            ORDER BY rank, wish.id DESC
+            LIMIT :limit OFFSET :offset
+        """)
+    return statement.bindparams(**params).columns(id=Integer, rank=Float)
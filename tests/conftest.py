@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# app.py configures itself from the environment when it is imported
+_directory = tempfile.mkdtemp(prefix='wishlist-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_directory, 'test.db')}"
+os.environ['FRAGMENT_CACHE'] = 'memory'
+os.environ.setdefault('INVITE_TOKEN', 'test-token')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,61 @@
+"""The dashboard loads in a constant number of queries, however many
+members a family has."""
+
+from sqlalchemy import event
+
+import app as wishlist
+from app import User, Wish, create_family, db
+
+# Upper bound for one dashboard render; a query per member would break it
+MAX_DASHBOARD_STATEMENTS = 6
+
+def seed_family(name, members, wishes_per_member=3):
+    """Create a family with members who each have some wishes; return one member's id."""
+    with wishlist.app.app_context():
+        family = create_family(name)
+        users = [User(name=f'{name} Mitglied {i}', family_id=family.id) for i in range(members)]
+        db.session.add_all(users)
+        db.session.flush()
+        db.session.add_all([
+            Wish(url='', name=f'Wunsch {j} von {user.name}', priority=j % 3 + 1,
+                 user_id=user.id, family_id=family.id)
+            for user in users for j in range(wishes_per_member)
+        ])
+        db.session.commit()
+        return users[0].id
+
+def dashboard_statements(user_id):
+    """Render the dashboard for a user with an empty fragment cache and count the SQL statements."""
+    client = wishlist.app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+
+    statements = []
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with wishlist.app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        response = client.get('/dashboard')
+        body = response.get_data(as_text=True)
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+    assert response.status_code == 200
+    return statements, body
+
+def test_dashboard_query_count_independent_of_family_size():
+    small = seed_family('Klein', members=2)
+    large = seed_family('Gross', members=20)
+    # The first request in a process may do one-off work; keep it out of the comparison
+    dashboard_statements(seed_family('Warmup', members=1))
+
+    small_statements, small_body = dashboard_statements(small)
+    large_statements, large_body = dashboard_statements(large)
+
+    assert 'Wunsch 2 von Klein Mitglied 1' in small_body
+    assert 'Wunsch 2 von Gross Mitglied 19' in large_body
+    assert len(large_statements) == len(small_statements), large_statements
+    assert len(small_statements) <= MAX_DASHBOARD_STATEMENTS, small_statements
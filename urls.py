@@ -0,0 +1,53 @@
+"""Canonical URLs for wishes.
+
+Two links to the same product should look the same: the scheme and host are
+lowercased, default ports, plain anchors and tracking parameters are dropped
+and the remaining query parameters are sorted. A wish stores the SHA-256 of its
+canonical URL in the indexed url_hash column, so duplicates within a family
+are found with one index lookup, and the metadata cache uses the same hash
+as its key.
+
+Links on known URL shorteners are resolved when their metadata is fetched;
+other redirects are not followed for this, since shops often redirect every
+product to a consent or login page.
+"""
+
+import hashlib
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
+
+# Query parameters that only say where a click came from. Generic names
+# like ref or tag are kept: some shops use them to pick the product.
+TRACKING_PARAMS = {'fbclid', 'gclid', 'gclsrc', 'dclid', 'gbraid', 'wbraid', 'msclkid', 'yclid',
+                   'igshid', 'mc_cid', 'mc_eid', '_ga', '_gl', 'srsltid'}
+TRACKING_PREFIXES = ('utm_', 'pd_rd_', 'pf_rd_')
+
+SHORTENER_HOSTS = {'amzn.to', 'amzn.eu', 'a.co', 'bit.ly', 'tinyurl.com', 't.co', 'goo.gl',
+                   'ow.ly', 'buff.ly', 'rebrand.ly', 'ebay.us', 'etsy.me', 'shorturl.at', 's.id'}
+
+def is_tracking_param(name):
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+def canonical_url(url):
+    """Return the canonical form of url, so equivalent spellings compare equal."""
+    parts = urlparse(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if (scheme, netloc.rsplit(':', 1)[-1]) in (('http', '80'), ('https', '443')):
+        netloc = netloc.rsplit(':', 1)[0]
+    query = urlencode(sorted((name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+                             if not is_tracking_param(name)))
+    # Fragments like #/product/1 or #!/product/1 are routes of single-page shops
+    fragment = parts.fragment if parts.fragment.startswith(('/', '!')) else ''
+    return urlunparse((scheme, netloc, parts.path or '/', parts.params, query, fragment))
+
+def url_hash(url):
+    """Return the hex SHA-256 of the canonical form of url, None for an empty url."""
+    if not url:
+        return None
+    return hashlib.sha256(canonical_url(url).encode('utf-8')).hexdigest()
+
+def is_short_url(url):
+    """Check whether url is on a known URL shortener."""
+    host = urlparse(url.strip()).hostname or ''
+    return host.removeprefix('www.') in SHORTENER_HOSTS
@@ -1,5 +1,5 @@
 import logging
-from app import app, db
+from app import app
 
 # Configure logging
 logging.basicConfig(
@@ -9,14 +9,8 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-try:
-    # Create database tables
-    with app.app_context():
-        db.create_all()
-        logger.info("Database tables created successfully")
-except Exception as e:
-    logger.error(f"Error creating database tables: {str(e)}")
-    raise
+# Tables are created by create_app(), or once in the gunicorn master when
+# started with gunicorn.conf.py
 
 if __name__ == "__main__":
     app.run()